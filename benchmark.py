@@ -0,0 +1,237 @@
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+
+from collections import Counter
+
+import pandas as pd
+
+import main
+from main import count_emojis, iter_messages, load_messages, prepare_data, write_messages_csv, write_message_store
+from synthetic_chats import TIMESTAMP_FORMATS, generate_exports, make_chat_lines
+
+#--------------------------------------------
+#Benchmarks for the chat pipeline
+#--------------------------------------------
+
+def benchmark_parser(line_count, repeats=3, dialect="android_de"):
+    text = "".join(make_chat_lines(line_count, dialect=dialect))
+    best = None
+    message_count = 0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        message_count = sum(1 for _ in iter_messages(io.StringIO(text)))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {"dialect": dialect, "lines": line_count, "messages": message_count, "seconds": best, "lines_per_sec": line_count / best}
+
+def benchmark_ingest(archive_count, lines_per_archive, workers):
+    # Serial vs. process pool ingest over archive_count synthetic ZIP exports
+    with tempfile.TemporaryDirectory() as tmp:
+        data_folder = os.path.join(tmp, 'chat_data')
+        os.makedirs(data_folder)
+        for i in range(archive_count):
+            with zipfile.ZipFile(os.path.join(data_folder, f'WhatsApp-Chat mit Chat{i:03d}.zip'), 'w') as zf:
+                zf.writestr(f'WhatsApp-Chat mit Chat{i:03d}.txt', "".join(make_chat_lines(lines_per_archive, seed=i)))
+
+        timings = {}
+        for mode, pool_size in (("serial", None), ("parallel", workers)):
+            csv_folder = os.path.join(tmp, 'csv_' + mode)
+            start = time.perf_counter()
+            prepare_data(data_folder, csv_folder, os.path.join(tmp, mode + '.csv'), workers=pool_size, interactive=False,
+                         store=os.path.join(tmp, 'store_' + mode))
+            timings[mode] = time.perf_counter() - start
+    return {"archives": archive_count, "workers": workers, "serial_seconds": timings["serial"],
+            "parallel_seconds": timings["parallel"], "speedup": timings["serial"] / timings["parallel"]}
+
+def benchmark_load(line_count):
+    # all_chats.csv + to_datetime (old analysis path) vs. projected load from the message store
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_file = os.path.join(tmp, 'all_chats.csv')
+        store = os.path.join(tmp, 'message_store')
+        write_messages_csv('Chat', iter_messages(make_chat_lines(line_count)), csv_file)
+        write_message_store(csv_file, store)
+
+        start = time.perf_counter()
+        df = pd.read_csv(csv_file)
+        df['Datum'] = pd.to_datetime(df['Datum'], format='%d.%m.%y')
+        csv_seconds = time.perf_counter() - start
+        csv_bytes = int(df.memory_usage(deep=True).sum())
+
+        start = time.perf_counter()
+        df = load_messages(['Chat', 'Timestamp', 'Is_Owner'], store)
+        store_seconds = time.perf_counter() - start
+        store_bytes = int(df.memory_usage(deep=True).sum())
+    return {"rows": len(df), "csv_seconds": csv_seconds, "csv_bytes": csv_bytes,
+            "store_seconds": store_seconds, "store_bytes": store_bytes}
+
+def legacy_is_emoji(character):
+    # Per-character range check of the old analyse_emoji loop, kept as the baseline
+    return '\U0001F600' <= character <= '\U0001F64F' or \
+           '\U0001F300' <= character <= '\U0001F5FF' or \
+           '\U0001F680' <= character <= '\U0001F6FF' or \
+           '\U0001F700' <= character <= '\U0001F77F' or \
+           '\U0001F780' <= character <= '\U0001F7FF' or \
+           '\U0001F800' <= character <= '\U0001F8FF' or \
+           '\U0001F900' <= character <= '\U0001F9FF' or \
+           '\U0001FA00' <= character <= '\U0001FA6F' or \
+           '\U0001FA70' <= character <= '\U0001FAFF' or \
+           '\U00002702' <= character <= '\U000027B0' or \
+           '\U000024C2' <= character <= '\U0001F251'
+
+def benchmark_emoji(line_count, emoji_density=0.05):
+    rows = [("Chat", sender, message) for _, _, sender, message in iter_messages(make_chat_lines(line_count, emoji_density=emoji_density))]
+    df = pd.DataFrame(rows, columns=["Chat", "Absender", "Nachricht"])
+
+    start = time.perf_counter()
+    legacy_counts = Counter(character for message in df['Nachricht'] for character in message if legacy_is_emoji(character))
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    counts = count_emojis(df)
+    engine_seconds = time.perf_counter() - start
+    return {"messages": len(df), "legacy_seconds": legacy_seconds, "engine_seconds": engine_seconds,
+            "speedup": legacy_seconds / engine_seconds, "legacy_emojis": sum(legacy_counts.values()),
+            "engine_emojis": int(counts['Count'].sum())}
+
+#--------------------------------------------
+#End-to-end suite: every stage at several scales, results as JSON
+#--------------------------------------------
+
+SENTIMENT_LIMIT = 20000  # TextBlob is far too slow for the big scales
+RSS_SAMPLE_SECONDS = 0.01
+
+def current_rss_bytes():
+    # Resident memory of this process right now: psutil if it is installed, else /proc (Linux), else None
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def measure(stage, scale, function, trace_memory):
+    # Peak RSS of this stage alone, sampled in a thread (ru_maxrss is a high-water mark of the whole process).
+    # Pool workers are separate processes and not included.
+    rss_start = current_rss_bytes()
+    rss_peak = [rss_start]
+    stop = threading.Event()
+
+    def sample_rss():
+        while rss_start is not None and not stop.wait(RSS_SAMPLE_SECONDS):
+            rss_peak[0] = max(rss_peak[0], current_rss_bytes())
+
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        rows = function()
+    finally:
+        seconds = time.perf_counter() - start
+        stop.set()
+        sampler.join()
+    peak_bytes = None
+    if trace_memory:
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    if rss_start is not None:
+        rss_peak[0] = max(rss_peak[0], current_rss_bytes())
+    result = {"scale": scale, "stage": stage, "seconds": seconds, "rows": rows, "peak_bytes": peak_bytes,
+              "rss_start_bytes": rss_start, "rss_peak_bytes": rss_peak[0]}
+    print(f"{scale:>10} {stage:<32} {seconds:9.3f}s" + (f" {peak_bytes / 1e6:10.1f} MB peak" if trace_memory else "")
+          + (f" {(rss_peak[0] - rss_start) / 1e6:10.1f} MB RSS growth" if rss_start is not None else ""))
+    return result
+
+def run_suite(scales, chat_count=10, workers=None, trace_memory=False):
+    results = []
+    cwd = os.getcwd()
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                results.append(measure("generate", scale, lambda: len(generate_exports('./chat_data', chat_count, scale)), False))
+                results.append(measure("prepare_data", scale,
+                                       lambda: sum(text['messages'] for entry, _ in prepare_data(workers=workers, interactive=False) for text in entry['texts']),
+                                       trace_memory))
+                results.append(measure("prepare_data (unchanged)", scale, lambda: len(prepare_data(workers=workers, interactive=False)), trace_memory))
+
+                def cold_load():
+                    main.invalidate_message_cache()
+                    return len(load_messages())
+                results.append(measure("load_messages", scale, cold_load, trace_memory))
+
+                main.owner_name = main.detect_owner_name()
+                chats = main.load_store_meta()['chats']
+                for mode, (_, data_function, _) in main.ANALYSIS_MODES.items():
+                    if data_function is main.sentiment_data and scale > SENTIMENT_LIMIT:
+                        continue
+                    try:
+                        results.append(measure("mode: " + mode, scale, lambda: len(data_function(chats)), trace_memory))
+                    except Exception as error:
+                        print(f"{scale:>10} mode: {mode:<26} failed: {error!r}")
+                        results.append({"scale": scale, "stage": "mode: " + mode, "error": repr(error)})
+            finally:
+                main.invalidate_message_cache()
+                os.chdir(cwd)
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput benchmarks for the WhatsApp chat parser")
+    parser.add_argument("--lines", type=int, default=200000, help="number of lines in the synthetic export")
+    parser.add_argument("--repeats", type=int, default=3, help="best-of repeats")
+    parser.add_argument("--archives", type=int, default=0, help="also benchmark serial vs. parallel ingest over this many archives")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="process pool size for the ingest benchmark")
+    parser.add_argument("--suite", action="store_true", help="run the end-to-end suite instead of the micro benchmarks")
+    parser.add_argument("--scales", default="10000,1000000,10000000", help="comma separated message counts for the suite")
+    parser.add_argument("--chats", type=int, default=10, help="number of chats in the suite's synthetic exports")
+    parser.add_argument("--memory", action="store_true", help="trace peak Python memory per stage (slower)")
+    parser.add_argument("--output", default="bench_results.json", help="results file of the suite")
+    args = parser.parse_args()
+
+    if args.suite:
+        results = run_suite([int(scale) for scale in args.scales.split(',')], args.chats, args.workers, args.memory)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"revision": git_revision(), "python": platform.python_version(), "platform": platform.platform(),
+                       "cpu_count": os.cpu_count(), "results": results}, f, indent=1)
+        print("Results written to " + args.output)
+        raise SystemExit
+
+    for dialect in TIMESTAMP_FORMATS:
+        result = benchmark_parser(args.lines, args.repeats, dialect)
+        print(f"parse ({dialect}): {result['lines']} lines, {result['messages']} messages, "
+              f"{result['seconds']:.3f}s, {result['lines_per_sec']:,.0f} lines/sec")
+
+    if args.archives:
+        result = benchmark_ingest(args.archives, args.lines // args.archives, args.workers)
+        print(f"ingest: {result['archives']} archives, serial {result['serial_seconds']:.2f}s, "
+              f"{result['workers']} workers {result['parallel_seconds']:.2f}s, speedup {result['speedup']:.2f}x")
+
+    result = benchmark_load(args.lines)
+    print(f"load: {result['rows']} rows, csv {result['csv_seconds']:.3f}s / {result['csv_bytes'] / 1e6:.1f} MB, "
+          f"store {result['store_seconds']:.3f}s / {result['store_bytes'] / 1e6:.1f} MB")
+
+    result = benchmark_emoji(args.lines)
+    print(f"emoji: {result['messages']} messages, loop {result['legacy_seconds']:.3f}s, "
+          f"engine {result['engine_seconds']:.3f}s, speedup {result['speedup']:.1f}x "
+          f"({result['legacy_emojis']} code points vs. {result['engine_emojis']} emoji clusters)")
@@ -0,0 +1,94 @@
+import argparse
+import asyncio
+import json
+import time
+import urllib.parse
+
+import numpy as np
+
+#--------------------------------------------
+#Load test for the JSON server (python main.py --serve): concurrent keep-alive clients,
+#reports requests/sec and latency percentiles
+#--------------------------------------------
+
+DEFAULT_PATHS = ["/modes", "/analysis/message_amount", "/analysis/average_message_length", "/analysis/time_of_day_analysis",
+                 "/analysis/answer_deviation", "/analysis/emoji_analysis", "/aggregates/month?senders={owner}",
+                 "/search?q=hallo"]
+
+async def request(reader, writer, host, path):
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode('latin-1'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    body = await reader.readexactly(length)
+    return status, body
+
+async def client(host, port, paths, next_request, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            index = next_request()
+            if index is None:
+                break
+            path = paths[index % len(paths)]
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, host, path)
+            latencies.append((path, time.perf_counter() - start))
+            if status != 200:
+                errors.append((path, status))
+    finally:
+        writer.close()
+
+async def run(url, paths, total, concurrency):
+    parts = urllib.parse.urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+
+    # Fill the {owner} placeholder from the server's meta
+    reader, writer = await asyncio.open_connection(host, port)
+    _, body = await request(reader, writer, host, "/modes")
+    writer.close()
+    owner = json.loads(body)['owner_name']
+    paths = [path.replace('{owner}', urllib.parse.quote(owner)) for path in paths]
+
+    issued = 0
+
+    def next_request():
+        nonlocal issued
+        if issued >= total:
+            return None
+        issued += 1
+        return issued - 1
+
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, paths, next_request, latencies, errors) for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+def report(latencies, errors, seconds):
+    values = np.array([latency for _, latency in latencies]) * 1000
+    print(f"{len(latencies)} requests in {seconds:.2f}s: {len(latencies) / seconds:,.1f} requests/sec, {len(errors)} errors")
+    print(f"latency ms: mean {values.mean():.1f}  p50 {np.percentile(values, 50):.1f}  "
+          f"p99 {np.percentile(values, 99):.1f}  max {values.max():.1f}")
+    for path in sorted({path for path, _ in latencies}):
+        path_values = np.array([latency for request_path, latency in latencies if request_path == path]) * 1000
+        print(f"  {path:<45} {len(path_values):>6}  p50 {np.percentile(path_values, 50):8.1f}  p99 {np.percentile(path_values, 99):8.1f}")
+    for path, status in errors[:10]:
+        print(f"  error {status}: {path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test for the chat analyzer JSON server")
+    parser.add_argument("--url", default="http://127.0.0.1:8765", help="server started with main.py --serve")
+    parser.add_argument("--requests", type=int, default=1000, help="total number of requests")
+    parser.add_argument("--concurrency", type=int, default=16, help="number of concurrent keep-alive connections")
+    parser.add_argument("--paths", help="comma separated request paths (default: a mix of modes, aggregates and search)")
+    args = parser.parse_args()
+
+    paths = args.paths.split(',') if args.paths else DEFAULT_PATHS
+    report(*asyncio.run(run(args.url, paths, args.requests, args.concurrency)))
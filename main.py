@@ -1,16 +1,33 @@
 import numpy as np
-import matplotlib.pyplot as plt
 import pandas as pd
 import re
+import itertools
 import csv
 import zipfile
+import queue
+import threading
+import hashlib
+import shutil
+import json
+import asyncio
+import http
+import urllib.parse
+import sqlite3
+import argparse
+import atexit
+import contextlib
+import cProfile
+import pstats
+import sys
+import tracemalloc
+import multiprocessing
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor, CancelledError
 import os
-import matplotlib.dates as mdates
-from datetime import datetime
+from collections import Counter, OrderedDict
 import tkinter as tk
 from tkinter import simpledialog
-from matplotlib.dates import MonthLocator, DateFormatter
-from textblob import TextBlob
+# matplotlib and textblob are imported inside the functions that use them, so the GUI opens quickly
 
 #--------------------------------------------
 #System variables
@@ -19,12 +36,104 @@ from textblob import TextBlob
 
 window = None
 owner_name = "Martin"
+store_folder = './message_store'
+message_cache = {}
+sentiment_cache_folder = './sentiment_cache'
+
+#--------------------------------------------
+#Instrumentation (opt-in: CHAT_ANALYZER_PROFILE=<report.json|report.txt> or --profile,
+#CHAT_ANALYZER_CPROFILE=<mode> or --cprofile-mode for a cProfile dump of one analysis mode)
+#--------------------------------------------
+
+profile_report_file = None
+cprofile_mode = os.environ.get('CHAT_ANALYZER_CPROFILE')
+stage_records = []
+stage_stack = []
+
+def enable_profiling(report_file):
+    global profile_report_file
+    profile_report_file = report_file
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    atexit.register(write_profile_report)
+
+def add_stage_record(stage, seconds, rows=None, peak_bytes=None):
+    stage_records.append({'stage': stage, 'seconds': seconds, 'rows': rows, 'peak_bytes': peak_bytes})
+
+@contextlib.contextmanager
+def instrument(stage, rows=None):
+    # Records wall time, rows (set record['rows'] inside the block) and peak traced memory of a stage
+    if not profile_report_file:
+        yield {}
+        return
+    record = {'rows': rows, 'child_peak': 0}
+    stage_stack.append(record)
+    tracemalloc.reset_peak()
+    start_bytes = tracemalloc.get_traced_memory()[0]
+    start = perf_counter()
+    try:
+        yield record
+    finally:
+        seconds = perf_counter() - start
+        # reset_peak() inside nested stages hides their peak from this one, so they hand it up
+        peak = max(tracemalloc.get_traced_memory()[1], record['child_peak'])
+        stage_stack.pop()
+        if stage_stack:
+            stage_stack[-1]['child_peak'] = max(stage_stack[-1]['child_peak'], peak)
+        tracemalloc.reset_peak()
+        # Reported relative to the memory in use when the stage started
+        add_stage_record(stage, seconds, record['rows'], peak - start_bytes)
+
+def call_with_stages(function, *args):
+    # For process pools: returns the result and the stages the worker recorded, so the parent can keep them
+    first = len(stage_records)
+    return function(*args), stage_records[first:]
+
+@contextlib.contextmanager
+def cprofile_hook(mode):
+    # cProfile of one selected analysis mode, written to "<mode>.prof" and summarized on stderr
+    if mode != cprofile_mode:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profile_file = mode.lower().replace(' ', '_') + '.prof'
+        profiler.dump_stats(profile_file)
+        print("cProfile of " + mode + " written to " + profile_file, file=sys.stderr)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(20)
+
+def write_profile_report():
+    if not profile_report_file or multiprocessing.parent_process() is not None:
+        return
+    totals = {}
+    for record in stage_records:
+        total = totals.setdefault(record['stage'], {'stage': record['stage'], 'calls': 0, 'seconds': 0.0, 'rows': 0, 'peak_bytes': 0})
+        total['calls'] += 1
+        total['seconds'] += record['seconds']
+        total['rows'] += record['rows'] or 0
+        total['peak_bytes'] = max(total['peak_bytes'], record['peak_bytes'] or 0)
+    totals = sorted(totals.values(), key=lambda total: total['seconds'], reverse=True)
+
+    with open(profile_report_file, 'w', encoding='utf-8') as f:
+        if profile_report_file.endswith('.json'):
+            json.dump({'totals': totals, 'stages': stage_records}, f, indent=1)
+        else:
+            f.write(f"{'stage':<40} {'calls':>6} {'seconds':>10} {'rows':>12} {'peak MB':>9}\n")
+            for total in totals:
+                f.write(f"{total['stage']:<40} {total['calls']:>6} {total['seconds']:>10.3f} {total['rows']:>12} {total['peak_bytes'] / 1e6:>9.1f}\n")
+
+if os.environ.get('CHAT_ANALYZER_PROFILE'):
+    enable_profiling(os.environ['CHAT_ANALYZER_PROFILE'])
+
+# Regex für das Format: "31.01.25, 02:17 - Absender: Nachricht"
+MESSAGE_PATTERN = re.compile(r"(\d{2}\.\d{2}\.\d{2}), (\d{2}:\d{2}) - (.+?): (.+)")
 
 def parse_message(line):
-    # Regex für das Format: "31.01.25, 02:17 - Absender: Nachricht"
-    pattern = r"(\d{2}\.\d{2}\.\d{2}), (\d{2}:\d{2}) - (.+?): (.+)"
-    
-    match = re.match(pattern, line.strip())
+    match = MESSAGE_PATTERN.match(line.strip())
     if match:
         date = match.group(1)
         time = match.group(2)
@@ -33,28 +142,135 @@ def parse_message(line):
         return (date, time, sender, message)
     return None
 
-def convert_txt_to_csv(chat_label, input_file, output_file):
-    with open(input_file, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-    
-    # Liste für die extrahierten Nachrichten
-    messages = []
-    
+#--------------------------------------------
+#Export dialects (Android/iOS, 12/24 hours, 2/4 digit years)
+#--------------------------------------------
+
+# Loose pattern, only used on the sampled first lines to find out which dialect a file uses:
+# "31.01.25, 02:17 - ", "31.01.2025, 02:17 - ", "[31/01/2025, 02:17:45] ", "1/31/25, 2:17 PM - ", ...
+DIALECT_PROBE = re.compile(r"\u200e?(\[)?(\d{1,2})([./-])(\d{1,2})\3(\d{4}|\d{2}),? (\d{1,2}):\d{2}(:\d{2})?"
+                           r"(?:[ \u202f]?([AaPp])\.? ?[Mm]\.?)?(?:\] | - )[^:]+: ")
+DIALECT_SAMPLE_LINES = 50
+DIALECT_SAMPLE_BYTES = 1 << 16
+# (bracketed, date separator, year digits, seconds, 12 hours, day first) - the German Android export
+DEFAULT_DIALECT = (False, '.', 2, False, False, True)
+dialect_parsers = {}
+
+def detect_dialect(sample_lines):
+    # The dialect most of the sampled message lines agree on
+    votes = Counter()
+    first_fields, second_fields = set(), set()
+    for line in sample_lines:
+        match = DIALECT_PROBE.match(line.strip())
+        if match:
+            bracketed, first, separator, second, year, _, seconds, am_pm = match.groups()
+            votes[(bool(bracketed), separator, len(year), bool(seconds), bool(am_pm))] += 1
+            first_fields.add(int(first))
+            second_fields.add(int(second))
+    if not votes:
+        return DEFAULT_DIALECT
+    bracketed, separator, year_digits, seconds, twelve_hour = votes.most_common(1)[0][0]
+    # Day and month order: a field above 12 decides it, otherwise US style for 12 hour clocks
+    if max(first_fields) > 12:
+        day_first = True
+    elif max(second_fields) > 12:
+        day_first = False
+    else:
+        day_first = separator == '.' or not twelve_hour
+    return (bracketed, separator, year_digits, seconds, twelve_hour, day_first)
+
+def detect_stream_dialect(raw):
+    # Samples the start of a binary stream and rewinds it
+    sample = raw.read(DIALECT_SAMPLE_BYTES)
+    raw.seek(0)
+    return detect_dialect(sample.decode('utf-8', errors='ignore').split('\n')[:DIALECT_SAMPLE_LINES])
+
+def padded_variants(number):
+    # "7" and "07" for 7 (only "12" for 12)
+    return {str(number), f"{number:02d}"}
+
+def dialect_parser(dialect):
+    # Line parser for one dialect with a single precompiled pattern. Dates and times come out
+    # in the canonical "31.01.25" / "02:17" form (minutes, like the German export).
+    # Day/month and hour:minute are matched as one group each and looked up in tables built once
+    # per dialect, so the hot path does no int()/zfill() work. What is left between the dialects is the
+    # pattern itself: about 1.0M lines/s for android_de, 0.85-0.95M for the others (benchmark.py).
+    if dialect == DEFAULT_DIALECT:
+        return parse_message
+    if dialect in dialect_parsers:
+        return dialect_parsers[dialect]
+
+    bracketed, separator, year_digits, seconds, twelve_hour, day_first = dialect
+    date = (r"(\d{1,2}" + re.escape(separator) + r"\d{1,2})" + re.escape(separator)
+            + (r"\d{2}" if year_digits == 4 else "") + r"(\d{2})")
+    time = r"(\d{1,2}:\d{2})" + (r":\d{2}" if seconds else "") + (r"[ \u202f]?([AaPp])\.? ?[Mm]\.?" if twelve_hour else "()")
+    timestamp = date + ",? " + time
+    pattern = re.compile(r"\u200e?\[" + timestamp + r"\] (.+?): (.+)" if bracketed else r"\u200e?" + timestamp + r" - (.+?): (.+)")
+    match_line = pattern.match
+
+    # "7/26" -> "26.07" (month first) or "26.7" -> "26.07", for every spelling of every day and month
+    day_months = {}
+    for day in range(1, 32):
+        for month in range(1, 13):
+            for day_text in padded_variants(day):
+                for month_text in padded_variants(month):
+                    written = day_text + separator + month_text if day_first else month_text + separator + day_text
+                    day_months[written] = f"{day:02d}.{month:02d}"
+    # "7:05" -> "07:05"; with a 12 hour clock per "A"/"P" (any case): "7:05" + "P" -> "19:05"
+    times = {'': {}}
+    for am_pm in ('AaPp' if twelve_hour else ''):
+        times[am_pm] = {}
+    for hour in range(24):
+        for minute in range(60):
+            for hour_text in padded_variants(hour):
+                times[''][f"{hour_text}:{minute:02d}"] = f"{hour:02d}:{minute:02d}"
+                if twelve_hour and 1 <= hour <= 12:
+                    for am_pm in 'AaPp':
+                        times[am_pm][f"{hour_text}:{minute:02d}"] = f"{hour % 12 + (12 if am_pm in 'Pp' else 0):02d}:{minute:02d}"
+
+    def parse(line):
+        match = match_line(line.strip())
+        if match is None:
+            return None
+        day_month, year, hour_minute, am_pm, sender, message = match.groups()
+        try:
+            return (day_months[day_month] + '.' + year, times[am_pm][hour_minute], sender, message)
+        except KeyError:
+            # Out of range ("32.13.", "0:15 AM"): padded as written, the timestamp becomes NaT in the store
+            first, second = day_month.split(separator)
+            day, month = (first, second) if day_first else (second, first)
+            hour, minute = hour_minute.split(':')
+            if am_pm:
+                hour = str(int(hour) % 12 + (12 if am_pm in 'Pp' else 0))
+            return (day.zfill(2) + '.' + month.zfill(2) + '.' + year, hour.zfill(2) + ':' + minute, sender, message)
+
+    dialect_parsers[dialect] = parse
+    return parse
+
+def iter_messages(lines, skip_lines=2, parse=None):
+    # Generator over (Datum, Uhrzeit, Absender, Nachricht) - reads the lines one by one
+    # and joins continuation lines, so memory stays flat regardless of file size.
+    # Without a parser the dialect is detected from the first lines.
+    if parse is None:
+        lines = iter(lines)
+        sample = list(itertools.islice(lines, DIALECT_SAMPLE_LINES))
+        parse = dialect_parser(detect_dialect(sample))
+        lines = itertools.chain(sample, lines)
     current_message = []
     current_date = current_time = current_sender = ""
-    
-    for line in lines:
-        
+
+    for line_number, line in enumerate(lines):
+
         #skip first two lines (whatsapp info messages)
-        if lines.index(line) < 2:
+        if line_number < skip_lines:
             continue
 
-        parsed = parse_message(line)
+        parsed = parse(line)
         if parsed:
-            # Wenn eine neue Nachricht erkannt wurde, speichern wir die alte Nachricht
+            # Wenn eine neue Nachricht erkannt wurde, geben wir die alte Nachricht zurück
             if current_message:
-                messages.append((chat_label, current_date, current_time, current_sender, "".join(current_message)))
-            
+                yield (current_date, current_time, current_sender, "".join(current_message))
+
             # Aktuelle Nachricht setzen
             current_date, current_time, current_sender, message = parsed
             current_message = [message]  # Nachricht starten
@@ -62,103 +278,1142 @@ def convert_txt_to_csv(chat_label, input_file, output_file):
         else:
             # Falls es keine neue Nachricht ist, fügen wir den Text zur aktuellen Nachricht hinzu
             current_message.append(line.strip())
-    
-    # Letzte Nachricht hinzufügen (falls vorhanden)
+
+    # Letzte Nachricht zurückgeben (falls vorhanden)
     if current_message:
-        messages.append((chat_label, current_date, current_time, current_sender, "".join(current_message)))
-    
-    # Schreiben in die CSV-Datei
+        yield (current_date, current_time, current_sender, "".join(current_message))
+
+CSV_COLUMNS = ["Chat", "Datum", "Uhrzeit", "Absender", "Nachricht"]
+
+def write_messages_csv(chat_label, messages, output_file):
+    # Schreiben in die CSV-Datei, Zeile für Zeile direkt aus dem Generator
+    row_count = 0
     with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
         csv_writer = csv.writer(csvfile)
-        csv_writer.writerow(["Chat", "Datum", "Uhrzeit", "Absender", "Nachricht"])
-        for message in messages:
-            csv_writer.writerow(message)
-
-def merge_csv_files(csv_folder, output_file):
-    # List to hold all rows of data
-    all_rows = []
-
-    # Go through each file in the folder
-    for file_name in os.listdir(csv_folder):
-        file_path = os.path.join(csv_folder, file_name)
-
-        # Only process CSV files
-        if file_path.endswith('.csv'):
-            with open(file_path, 'r', encoding='utf-8') as file:
-                csv_reader = csv.reader(file)
-                # Skip header in all but the first file
-                header = next(csv_reader)  # Read the header
-
-                # If this is the first file, add the header to the output file
-                if not all_rows:
-                    all_rows.append(header)
-                
-                # Append rows from the current CSV file
-                for row in csv_reader:
-                    all_rows.append(row)
-
-    # Write all the rows to the output file
-    with open(output_file, 'w', newline='', encoding='utf-8') as output:
-        csv_writer = csv.writer(output)
-        # Write all rows
-        csv_writer.writerows(all_rows)
-
-def prepare_data():
-    data_folder = './chat_data'
-    csv_folder = './csv_data'
+        csv_writer.writerow(CSV_COLUMNS)
+        for date, time, sender, message in messages:
+            csv_writer.writerow((chat_label, date, time, sender, message))
+            row_count += 1
+    return row_count
+
+def convert_txt_to_csv(chat_label, input_file, output_file):
+    with open(input_file, 'r', encoding='utf-8') as f:
+        return write_messages_csv(chat_label, iter_messages(f), output_file)
+
+def merge_csv_files(csv_files, output_file):
+    with instrument('merge'):
+        with open(output_file, 'w', newline='', encoding='utf-8') as output:
+            csv.writer(output).writerow(CSV_COLUMNS)
+        append_csv_rows(output_file, [(file_path, 0) for file_path in csv_files])
+
+def append_csv_rows(output_file, csv_tails):
+    # Copies the rows of (CSV file, byte offset) pairs byte for byte - nothing is parsed or held in memory.
+    # Offset 0 stands for all rows after the file's header.
+    with open(output_file, 'ab') as output:
+        for file_path, offset in csv_tails:
+            with open(file_path, 'rb') as file:
+                if offset:
+                    file.seek(offset)
+                else:
+                    file.readline()
+                shutil.copyfileobj(file, output, 1 << 20)
+
+def read_csv_rows(file_path, offset=0):
+    # Rows of a chat CSV from a byte offset on (0 = all rows), every column as a string
+    with open(file_path, 'rb') as file:
+        if offset:
+            file.seek(offset)
+        try:
+            return pd.read_csv(file, header=None if offset else 0, names=CSV_COLUMNS, dtype=str, keep_default_na=False, encoding='utf-8')
+        except pd.errors.EmptyDataError:
+            return pd.DataFrame({column: pd.Series(dtype=str) for column in CSV_COLUMNS})
+
+def csv_columns(csv_tails):
+    # Typed store columns of the rows in (CSV file, byte offset) pairs - the part of the store an ingest worker builds.
+    # The word/bigram counts of the rows ('terms', keyed by the part's chat codes) are counted here too,
+    # so the parent only inserts them into the search index
+    df = pd.concat([read_csv_rows(file_path, offset) for file_path, offset in csv_tails], ignore_index=True)
+    with instrument('store columns', len(df)):
+        columns = message_store_columns(df)
+    with instrument('term counts', len(df)):
+        columns['terms'] = term_counts(columns['Chat'], columns['Nachricht'].split('\n')) if columns['rows'] else {}
+    return columns
+
+def iter_chat_texts(file_path):
+    # Liefert (Dateiname, Binärstream) für jede Chat-Textdatei - direkt aus dem ZIP ohne Entpacken
+    if zipfile.is_zipfile(file_path):
+        with instrument('zip open'):
+            zip_ref = zipfile.ZipFile(file_path, 'r')
+            members = [member for member in zip_ref.infolist() if not member.is_dir() and member.filename.endswith('.txt')]
+        with zip_ref:
+            for member in members:
+                with zip_ref.open(member) as raw:
+                    yield os.path.basename(member.filename), raw
+    elif file_path.endswith('.txt'):
+        with open(file_path, 'rb') as raw:
+            yield os.path.basename(file_path), raw
+
+def iter_tracked_lines(raw, state):
+    # Decodes the lines of a binary stream and keeps the byte offset and a running hash in state.
+    # While a line is being processed, state['hash'] covers exactly the bytes before it.
+    for raw_line in raw:
+        state['line_start'] = state['offset']
+        yield raw_line.decode('utf-8')
+        state['hash'].update(raw_line)
+        state['offset'] += len(raw_line)
+
+def hash_prefix(raw, length):
+    prefix_hash = hashlib.sha256()
+    remaining = length
+    while remaining > 0:
+        chunk = raw.read(min(remaining, 1 << 20))
+        if not chunk:
+            break
+        prefix_hash.update(chunk)
+        remaining -= len(chunk)
+    return prefix_hash, remaining == 0
+
+def ingest_chat_text(raw, label, output_path, previous=None):
+    # Parse one chat text into output_path. If the text starts with the bytes that were ingested
+    # last time, only the tail after the previously last message is parsed and appended.
+    parse = dialect_parser(detect_stream_dialect(raw))
+    state = {'offset': 0, 'hash': hashlib.sha256(), 'line_start': 0}
+    skip_lines = 2
+    appending = False
+    if previous and previous['resume_offset'] and os.path.exists(output_path):
+        prefix_hash, complete = hash_prefix(raw, previous['resume_offset'])
+        if complete and prefix_hash.hexdigest() == previous['prefix_hash']:
+            state.update(offset=previous['resume_offset'], hash=prefix_hash)
+            skip_lines = 0
+            appending = True
+        else:
+            raw.seek(0)
+
+    messages = iter_messages(iter_tracked_lines(raw, state), skip_lines, parse)
+
+    # Resume point for the next run: start of the last message and the hash of everything before it
+    resume = (0, None)
+    last_trigger = (0, None)
+    if appending:
+        # The tail starts with the last message of the previous run, which is already stored
+        next(messages, None)
+        last_trigger = (state['line_start'], state['hash'].copy())
+    rows_start = os.path.getsize(output_path) if appending else 0
+    message_count = previous['messages'] if appending else 0
+    # Parsing and writing are interleaved, with profiling on the writes are timed separately
+    start = perf_counter()
+    write_seconds = 0.0
+    with open(output_path, 'a' if appending else 'w', newline='', encoding='utf-8') as csvfile:
+        csv_writer = csv.writer(csvfile)
+        if not appending:
+            csv_writer.writerow(CSV_COLUMNS)
+        for date, time, sender, message in messages:
+            # Every message but the last one is yielded when the next message's first line is read
+            resume = last_trigger
+            last_trigger = (state['line_start'], state['hash'].copy())
+            row = (label, date, time, sender, message)
+            if profile_report_file:
+                write_start = perf_counter()
+                csv_writer.writerow(row)
+                write_seconds += perf_counter() - write_start
+            else:
+                csv_writer.writerow(row)
+            message_count += 1
+    if profile_report_file:
+        rows = message_count - (previous['messages'] if appending else 0)
+        add_stage_record('parse', perf_counter() - start - write_seconds, rows)
+        add_stage_record('csv write', write_seconds, rows)
+
+    if appending and resume[1] is None:
+        # Nothing new after the previous last message - keep the old resume point
+        resume_offset, prefix_hash = previous['resume_offset'], previous['prefix_hash']
+    else:
+        resume_offset, prefix_hash = resume[0], resume[1].hexdigest() if resume[1] else None
+    entry = {'csv': output_path, 'resume_offset': resume_offset, 'prefix_hash': prefix_hash, 'messages': message_count}
+    # rows_start: byte offset of the rows written now (0 = the text was parsed from the start)
+    return entry, rows_start
+
+def chat_label_from_file_name(file_name):
+    # "WhatsApp-Chat mit Anna.zip" -> "Anna"
+    label = os.path.splitext(file_name)[0]
+    for prefix in ('WhatsApp-Chat mit ', 'WhatsApp Chat mit ', 'WhatsApp Chat with '):
+        if label.startswith(prefix):
+            label = label[len(prefix):]
+    return label.strip()
+
+def load_chat_labels(labels_file):
+    # Optional mapping file {"<archive name>": "<chat label>"} for unattended runs
+    if not os.path.exists(labels_file):
+        return {}
+    with open(labels_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def is_chat_file(file_path):
+    return zipfile.is_zipfile(file_path) or file_path.endswith('.txt')
+
+def unlabelled_archives(data_folder='./chat_data', csv_folder='./csv_data'):
+    # Archives that have no chat label yet (neither in labels.json nor from an earlier run)
+    if not os.path.isdir(data_folder):
+        return []
+    labels = load_chat_labels(os.path.join(data_folder, 'labels.json'))
+    manifest = load_manifest(os.path.join(csv_folder, 'manifest.json'))
+    return [file_name for file_name in sorted(os.listdir(data_folder))
+            if is_chat_file(os.path.join(data_folder, file_name)) and not labels.get(file_name)
+            and not (file_name in manifest and manifest[file_name]['label'])]
+
+def load_manifest(manifest_file):
+    # {"<archive name>": {"label", "size", "mtime_ns", "texts": [{"csv", "resume_offset", "prefix_hash", "messages"}]}}
+    if not os.path.exists(manifest_file):
+        return {}
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def ingest_archive(file_path, label, csv_folder, previous=None):
+    # Parse one archive into csv_folder. Returns the new manifest entry and the parsed part:
+    # {'appended': only new messages were parsed, 'csv_tails': (CSV, byte offset) of the rows written now,
+    #  'columns': typed store columns of those rows}. The columns are built here, in the worker.
+    archive_name = os.path.splitext(os.path.basename(file_path))[0]
+    stat = os.stat(file_path)
+    previous_texts = previous['texts'] if previous and previous['label'] == label else []
+    entry = {'label': label, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'texts': []}
+    csv_tails = []
+    for index, (text_name, raw) in enumerate(iter_chat_texts(file_path)):
+        output_file = archive_name + ('.csv' if index == 0 else '_' + str(index) + '.csv')
+        output_path = os.path.join(csv_folder, output_file)
+        text_entry, rows_start = ingest_chat_text(raw, label, output_path, previous_texts[index] if index < len(previous_texts) else None)
+        entry['texts'].append(text_entry)
+        csv_tails.append((output_path, rows_start))
+    appended = len(entry['texts']) == len(previous_texts) and all(rows_start for _, rows_start in csv_tails)
+    return entry, {'appended': appended, 'csv_tails': csv_tails, 'columns': csv_columns(csv_tails)}
+
+def prepare_data(data_folder='./chat_data', csv_folder='./csv_data', output_file='./all_chats.csv', workers=None, interactive=True, store=None, incremental=True,
+                 progress=None, cancel=None, chat_labels=None):
+    # workers=None -> serial, otherwise the archives are parsed across a process pool of that size.
+    # chat_labels {"<archive name>": "<chat label>"} take precedence over labels.json (the GUI asks for them up front).
+    # incremental: unchanged archives are skipped, re-exports only append their new messages.
+    # progress(archives_done, archives_total, messages_parsed) is called after every archive. Once
+    # cancel (a threading.Event) is set no further archives are started; finished ones are still stored.
+    # Row order of all_chats.csv and the store: a rebuild writes the archives sorted by name, incremental runs
+    # append at the end. Analyses must not depend on it (they order by chat and time where it matters).
+    store = store or store_folder
+    labels_file = os.path.join(data_folder, 'labels.json')
+    manifest_file = os.path.join(csv_folder, 'manifest.json')
 
     os.makedirs(data_folder, exist_ok=True)
     os.makedirs(csv_folder, exist_ok=True)
 
-    for file_name in os.listdir(data_folder):
+    labels = {**load_chat_labels(labels_file), **(chat_labels or {})}
+    manifest = load_manifest(manifest_file) if incremental else {}
+    jobs = []
+    for file_name in sorted(os.listdir(data_folder)):
         file_path = os.path.join(data_folder, file_name)
-        
-        # Überprüfen, ob die Datei eine ZIP-Datei ist
-        if zipfile.is_zipfile(file_path):
-            # Erstelle einen Ordner zum Entpacken
-            extract_folder = os.path.join(data_folder, file_name.replace('.zip', '_extracted'))
-            os.makedirs(extract_folder, exist_ok=True)
-
-            # Entpacke die ZIP-Datei
-            with zipfile.ZipFile(file_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_folder)
-            
-            # Durchlaufe die entpackten Dateien und suche nach einer Textdatei
-            for extracted_file in os.listdir(extract_folder):
-                extracted_file_path = os.path.join(extract_folder, extracted_file)
-                if extracted_file.endswith('.txt'):
-                    # Konvertiere die Textdatei in eine CSV-Datei
-                    output_file = extracted_file.replace('.txt', '.csv')
-                    label = input("Enter the name of the chat - " + file_name.replace('.zip', '') + ": ")
-                    #label = file_name.replace('WhatsApp-Chat mit ', '').replace('.zip', '')
-                    convert_txt_to_csv(label, extracted_file_path, os.path.join(csv_folder, output_file))
-
-            #remove all extracted files
-            for extracted_file in os.listdir(extract_folder):
-                extracted_file_path = os.path.join(extract_folder, extracted_file)
-                os.remove(extracted_file_path)
-            os.rmdir(extract_folder)
-    merge_csv_files(csv_folder, './all_chats.csv')
-
-def is_emoji(character):
+        if not is_chat_file(file_path):
+            continue
+
+        previous = manifest.get(file_name)
+        label = labels.get(file_name) or (previous and previous['label'])
+        if not label:
+            if interactive and workers is None:
+                label = input("Enter the name of the chat - " + os.path.splitext(file_name)[0] + ": ")
+            else:
+                label = chat_label_from_file_name(file_name)
+
+        stat = os.stat(file_path)
+        if previous and previous['label'] == label and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns:
+            continue  # unchanged since the last run
+        jobs.append((file_name, (file_path, label, csv_folder, previous)))
+
+    store_complete = os.path.exists(output_file) and os.path.exists(os.path.join(store, 'meta.json'))
+    if not jobs and store_complete:
+        update_search_index(store)
+        write_media_inventory(data_folder, manifest, store)
+        return []
+
+    done_jobs = []
+    results = []
+    messages_parsed = 0
+
+    def archive_done(job, result):
+        nonlocal messages_parsed
+        done_jobs.append(job)
+        results.append(result)
+        messages_parsed += sum(text['messages'] for text in result[0]['texts'])
+        if progress:
+            progress(len(results), len(jobs), messages_parsed)
+
+    if workers is None:
+        for job in jobs:
+            if cancel is not None and cancel.is_set():
+                break
+            archive_done(job, ingest_archive(*job[1]))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(call_with_stages, ingest_archive, *job[1]) for job in jobs]
+            # Collected in job order, so the merge stays deterministic
+            for job, future in zip(jobs, futures):
+                if cancel is not None and cancel.is_set():
+                    future.cancel()
+                if not future.cancelled():
+                    result, stages = future.result()
+                    stage_records.extend(stages)
+                    archive_done(job, result)
+    jobs = done_jobs
+
+    # Re-exports that only gained messages and archives of chats that are not in the store yet are appended
+    store_chats = set(load_store_meta(store)['chats']) if store_complete else set()
+    appendable = [part['appended'] or (args[3] is None and args[1] not in store_chats) for (_, args), (_, part) in zip(jobs, results)]
+    for (file_name, _), (entry, _) in zip(jobs, results):
+        manifest[file_name] = entry
+    if store_complete and all(appendable):
+        append_csv_rows(output_file, [tail for _, part in results for tail in part['csv_tails']])
+        parts = [part['columns'] for _, part in results]
+        append_message_store(parts, store)
+    else:
+        # Rebuilt from every archive in the manifest, sorted by name. Archives that were parsed from the
+        # start just now bring their columns, the others are read back from their CSVs (in the pool, too).
+        parsed = {file_name: part for (file_name, _), (_, part) in zip(jobs, results) if not part['appended']}
+        archives = sorted(manifest)
+        missing = [[(text['csv'], 0) for text in manifest[file_name]['texts']] for file_name in archives if file_name not in parsed]
+        if workers is None:
+            read_parts = [csv_columns(csv_tails) for csv_tails in missing]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                read_parts = []
+                for columns, stages in executor.map(call_with_stages, itertools.repeat(csv_columns), missing):
+                    stage_records.extend(stages)
+                    read_parts.append(columns)
+        read_parts = iter(read_parts)
+        merge_csv_files([text['csv'] for file_name in archives for text in manifest[file_name]['texts']], output_file)
+        parts = [parsed[file_name]['columns'] if file_name in parsed else next(read_parts) for file_name in archives]
+        build_message_store(parts, store)
+    update_search_index(store, parts)
+
+    with open(manifest_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    write_media_inventory(data_folder, manifest, store)
+    return results
+
+#--------------------------------------------
+#Message store (one typed .npy file per column)
+#--------------------------------------------
+
+def find_owner_name(chats, senders, chat_count, sender_categories):
+    # The owner is the only sender that appears in every chat (chats/senders: code arrays)
+    if not chat_count or not sender_categories:
+        return owner_name
+    sender_count = len(sender_categories)
+    pair_counts = np.bincount(chats.astype(np.int64) * sender_count + senders, minlength=chat_count * sender_count).reshape(chat_count, sender_count)
+    common_elements = np.flatnonzero((pair_counts > 0).all(axis=0))  # Keep only senders present in all chats
+    if not len(common_elements):
+        return owner_name
+    # With a single chat every sender is "common" - take the most active one
+    sender_counts = pair_counts.sum(axis=0)
+    return sender_categories[common_elements[sender_counts[common_elements].argmax()]]
+
+def message_store_columns(df):
+    # Typed column arrays for the rows in df (Chat, Datum, Uhrzeit, Absender, Nachricht as strings).
+    # Chat/Absender are coded against the part's own names ('chats', 'senders'), combine_store_columns
+    # maps them to the store's categories. Datum/Uhrzeit are parsed exactly once, here
+    timestamps = pd.to_datetime(df['Datum'] + ' ' + df['Uhrzeit'], format='%d.%m.%y %H:%M', errors='coerce')
+    # Messages never contain line breaks (continuation lines are joined), so '\n' separates them on disk
+    messages = df['Nachricht'].str.replace('\n', ' ', regex=False)
+    chats = pd.Categorical(df['Chat'])
+    senders = pd.Categorical(df['Absender'])
+    return {
+        'rows': len(df),
+        'chats': list(chats.categories),
+        'senders': list(senders.categories),
+        'Timestamp': timestamps.to_numpy(dtype='datetime64[ns]').view(np.int64),
+        'Chat': chats.codes.astype(np.int32),
+        'Absender': senders.codes.astype(np.int32),
+        'Message_Length': messages.str.len().to_numpy(np.int32),
+        'Nachricht_bytes': messages.str.encode('utf-8').str.len().to_numpy(np.int64) + 1,
+        'Nachricht': '\n'.join(messages),
+    }
+
+def combine_store_columns(parts, chat_categories, sender_categories, owner):
+    # Concatenates parts of message_store_columns, with their codes mapped to the store's categories
+    columns = {}
+    for column, key, categories in (('Chat', 'chats', chat_categories), ('Absender', 'senders', sender_categories)):
+        columns[column] = np.concatenate([np.zeros(0, np.int32)] + [
+            pd.Index(categories).get_indexer(part[key]).astype(np.int32)[part[column]] for part in parts if part['rows']])
+    for column, dtype in (('Timestamp', np.int64), ('Message_Length', np.int32), ('Nachricht_bytes', np.int64)):
+        columns[column] = np.concatenate([np.zeros(0, dtype)] + [part[column] for part in parts])
+    owner_code = sender_categories.index(owner) if owner in sender_categories else -1
+    columns['Is_Owner'] = columns['Absender'] == owner_code
+    return columns, '\n'.join(part['Nachricht'] for part in parts if part['rows'])
+
+def save_message_store(store, columns, text, meta, text_mode='w'):
+    with instrument('store write', meta['rows']):
+        for column in ('Timestamp', 'Chat', 'Absender', 'Is_Owner', 'Message_Length', 'Nachricht_offsets'):
+            np.save(os.path.join(store, column + '.npy'), columns[column])
+        with open(os.path.join(store, 'Nachricht.txt'), text_mode, encoding='utf-8', newline='') as f:
+            if text_mode == 'a':
+                f.write('\n')
+            f.write(text)
+    with instrument('aggregation: rollups', meta['rows']):
+        save_rollups(store, columns, meta)
+    # meta.json is written last, its stat is the version of the store
+    with open(os.path.join(store, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    invalidate_message_cache()
+
+def write_message_store(csv_file, store=None):
+    with instrument('store read csv') as stage:
+        df = read_csv_rows(csv_file)
+        stage['rows'] = len(df)
+    return build_message_store([message_store_columns(df)], store)
+
+def build_message_store(parts, store=None):
+    # New store from parts of message_store_columns, in their order
+    store = store or store_folder
+    chat_categories = sorted(set().union(*(part['chats'] for part in parts)))
+    sender_categories = sorted(set().union(*(part['senders'] for part in parts)))
+    columns, text = combine_store_columns(parts, chat_categories, sender_categories, None)
+    detected_owner = find_owner_name(columns['Chat'], columns['Absender'], len(chat_categories), sender_categories)
+    columns['Is_Owner'] = columns['Absender'] == (sender_categories.index(detected_owner) if detected_owner in sender_categories else -1)
+    columns['Nachricht_offsets'] = np.concatenate([[0], np.cumsum(columns['Nachricht_bytes'])])
+    meta = {
+        'rows': len(columns['Timestamp']),
+        'chats': chat_categories,
+        'senders': sender_categories,
+        'owner_name': detected_owner,
+    }
+
+    tmp_folder = store + '.tmp'
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    os.makedirs(tmp_folder)
+    save_message_store(tmp_folder, columns, text, meta)
+
+    # Swap in the new store only once it is complete
+    shutil.rmtree(store, ignore_errors=True)
+    os.replace(tmp_folder, store)
+    invalidate_message_cache()
+    return meta
+
+def append_message_store(parts, store=None):
+    # Append parts of message_store_columns; codes stay stable, new names extend the categories
+    store = store or store_folder
+    if not sum(part['rows'] for part in parts):
+        return load_store_meta(store)
+    with open(os.path.join(store, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    meta['chats'] = meta['chats'] + sorted(set().union(*(part['chats'] for part in parts)) - set(meta['chats']))
+    meta['senders'] = meta['senders'] + sorted(set().union(*(part['senders'] for part in parts)) - set(meta['senders']))
+
+    new_columns, text = combine_store_columns(parts, meta['chats'], meta['senders'], meta['owner_name'])
+    columns = {}
+    for column in ('Timestamp', 'Chat', 'Absender', 'Is_Owner', 'Message_Length'):
+        columns[column] = np.concatenate([np.load(os.path.join(store, column + '.npy')), new_columns[column]])
+    # The owner is detected again over all rows (a new chat can show that the first guess was wrong).
+    # Rollups and everything else take the owner from meta, only Is_Owner has to be rewritten.
+    detected_owner = find_owner_name(columns['Chat'], columns['Absender'], len(meta['chats']), meta['senders'])
+    if detected_owner != meta['owner_name']:
+        meta['owner_name'] = detected_owner
+        columns['Is_Owner'] = columns['Absender'] == (meta['senders'].index(detected_owner) if detected_owner in meta['senders'] else -1)
+    message_ends = np.cumsum(new_columns['Nachricht_bytes'])
+    if meta['rows']:
+        # The first new message starts after the separator that is written in front of it
+        offsets = np.load(os.path.join(store, 'Nachricht_offsets.npy'))
+        columns['Nachricht_offsets'] = np.concatenate([offsets, offsets[-1] + message_ends])
+        text_mode = 'a'
+    else:
+        columns['Nachricht_offsets'] = np.concatenate([[0], message_ends])
+        text_mode = 'w'
+    meta['rows'] += len(new_columns['Timestamp'])
+    save_message_store(store, columns, text, meta, text_mode)
+    return meta
+
+#--------------------------------------------
+#Filters of the analysis API, active for the current thread inside filtered_analysis()
+#--------------------------------------------
+
+active_filters = threading.local()
+
+def current_filters():
+    # {'chats', 'senders', 'since', 'until', 'owner'}, only the ones that are set
+    return getattr(active_filters, 'filters', None) or {}
+
+@contextlib.contextmanager
+def filtered_analysis(chats=None, senders=None, since=None, until=None, owner=None):
+    previous = getattr(active_filters, 'filters', None)
+    filters = {'chats': chats, 'senders': senders, 'since': since, 'until': until, 'owner': owner}
+    active_filters.filters = {key: value for key, value in filters.items() if value is not None}
+    try:
+        yield
+    finally:
+        active_filters.filters = previous
+
+def current_owner():
+    return current_filters().get('owner') or owner_name
+
+def filter_mask(df, filters):
+    mask = np.ones(len(df), dtype=bool)
+    if 'chats' in filters:
+        mask &= df['Chat'].isin(filters['chats']).to_numpy()
+    if 'senders' in filters:
+        mask &= df['Absender'].isin(filters['senders']).to_numpy()
+    if 'since' in filters:
+        mask &= (df['Timestamp'] >= pd.Timestamp(filters['since'])).to_numpy()
+    if 'until' in filters:
+        mask &= (df['Timestamp'] < pd.Timestamp(filters['until'])).to_numpy()
+    return mask
+
+def store_version(store):
+    # Changes whenever the store is rewritten (meta.json is replaced together with the columns)
+    stat = os.stat(os.path.join(store, 'meta.json'))
+    return (stat.st_mtime_ns, stat.st_size)
+
+def invalidate_message_cache():
+    message_cache.clear()
+    with analysis_cache_lock:
+        analysis_cache.clear()
+
+def load_store_meta(store=None):
+    # Parsed meta and columns are kept for the session and dropped when the store on disk changes
+    store = store or store_folder
+    version = store_version(store)
+    if message_cache.get('store') != store or message_cache.get('version') != version:
+        message_cache.clear()
+        with open(os.path.join(store, 'meta.json'), 'r', encoding='utf-8') as f:
+            message_cache.update(store=store, version=version, meta=json.load(f), columns={})
+    return message_cache['meta']
+
+def load_column(column, store, meta):
+    with instrument('load ' + column, meta['rows']):
+        return read_column(column, store, meta)
+
+def read_column(column, store, meta):
+    column_path = os.path.join(store, column + '.npy')
+    if column == 'Timestamp':
+        values = np.load(column_path).view('datetime64[ns]')
+    elif column == 'Chat':
+        return pd.Categorical.from_codes(np.load(column_path), categories=meta['chats'])
+    elif column == 'Absender':
+        return pd.Categorical.from_codes(np.load(column_path), categories=meta['senders'])
+    elif column == 'Nachricht':
+        with open(os.path.join(store, 'Nachricht.txt'), 'r', encoding='utf-8', newline='') as f:
+            return pd.Series(f.read().split('\n') if meta['rows'] else [], dtype=str).array
+    else:
+        values = np.load(column_path)
+    values.flags.writeable = False
+    return values
+
+def load_messages(columns=('Chat', 'Absender', 'Timestamp', 'Is_Owner', 'Message_Length', 'Nachricht'), store=None):
+    # Only the requested columns are read from disk, each at most once per session.
+    # The frame shares the cached (read-only) arrays, so adding columns to it is cheap and safe.
+    # Inside filtered_analysis() only the matching rows are returned (the index keeps their store row numbers).
+    store = store or store_folder
+    meta = load_store_meta(store)
+    filters = current_filters()
+    owner = filters.get('owner')
+    needed = list(columns)
+    for column, used in (('Chat', 'chats' in filters), ('Absender', 'senders' in filters or (owner and 'Is_Owner' in columns)),
+                         ('Timestamp', 'since' in filters or 'until' in filters)):
+        if used and column not in needed:
+            needed.append(column)
+
+    cached_columns = message_cache['columns']
+    for column in needed:
+        if column not in cached_columns:
+            cached_columns[column] = load_column(column, store, meta)
+    df = pd.DataFrame({column: cached_columns[column] for column in needed}, copy=False)
+    if not filters:
+        return df
+
+    df = df[filter_mask(df, filters)]
+    if owner and 'Is_Owner' in columns:
+        df['Is_Owner'] = (df['Absender'] == owner).to_numpy()
+    return df[list(columns)]
+
+#--------------------------------------------
+#Rollups (message/character counts per chat x sender x month and x hour x weekday)
+#--------------------------------------------
+
+def rollup_counts(keys, lengths, counts=None):
+    # Message and character count per distinct key, without any per-row Python code.
+    # With counts, keys/lengths/counts are partial results that are merged (summed per key).
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse, weights=counts, minlength=len(unique_keys)).astype(np.int64)
+    characters = np.bincount(inverse, weights=lengths, minlength=len(unique_keys)).astype(np.int64)
+    return unique_keys, counts, characters
+
+def save_rollups(store, columns, meta):
+    # Materialized at ingest time from the full column arrays, so the time based modes never touch raw rows
+    timestamps = columns['Timestamp']
+    valid = timestamps != np.iinfo(np.int64).min  # NaT
+    timestamps = timestamps[valid].view('datetime64[ns]')
+    chats = columns['Chat'][valid].astype(np.int64)
+    senders = columns['Absender'][valid].astype(np.int64)
+    lengths = columns['Message_Length'][valid]
+    sender_count = max(len(meta['senders']), 1)
+    chat_sender = chats * sender_count + senders
+
+    months = timestamps.astype('datetime64[M]').astype(np.int64)
+    first_month = months.min() if len(months) else 0
+    month_span = (months.max() - first_month + 1) if len(months) else 1
+    keys, counts, characters = rollup_counts(chat_sender * month_span + (months - first_month), lengths)
+    np.savez(os.path.join(store, 'rollup_month.npz'),
+             Chat=keys // month_span // sender_count, Absender=keys // month_span % sender_count,
+             Month=keys % month_span + first_month, Message_Count=counts, Character_Count=characters)
+
+    days = timestamps.astype('datetime64[D]').astype(np.int64)
+    hours = (timestamps - timestamps.astype('datetime64[D]')).astype('timedelta64[h]').astype(np.int64)
+    weekdays = (days + 3) % 7  # 1970-01-01 was a Thursday, Monday = 0
+    keys, counts, characters = rollup_counts((chat_sender * 24 + hours) * 7 + weekdays, lengths)
+    np.savez(os.path.join(store, 'rollup_hour.npz'),
+             Chat=keys // 7 // 24 // sender_count, Absender=keys // 7 // 24 % sender_count,
+             Hour=keys // 7 % 24, Weekday=keys % 7, Message_Count=counts, Character_Count=characters)
+
+def load_rollup(name, store=None):
+    # name: 'month' (Chat, Absender, Month) or 'hour' (Chat, Absender, Hour, Weekday), plus Is_Owner and the counts.
+    # Inside filtered_analysis() sender and date filters need the raw rows, a chat filter only selects rollup rows.
+    store = store or store_folder
+    filters = current_filters()
+    if 'senders' in filters or 'since' in filters or 'until' in filters:
+        rollup = filtered_rollup(name, store)
+    else:
+        rollup = load_stored_rollup(name, store)
+        if 'chats' in filters:
+            rollup = rollup[rollup['Chat'].isin(filters['chats'])]
+    if 'owner' in filters:
+        rollup = rollup.assign(Is_Owner=rollup['Absender'] == filters['owner'])
+    return rollup
+
+def filtered_rollup(name, store):
+    # Same frame as the stored rollup, aggregated from the rows that pass the active filters
+    meta = load_store_meta(store)
+    if chunk_memory:
+        with instrument('chunked rollup ' + name, meta['rows']):
+            return chunked_rollup(name, store, current_filters())
+    df = load_messages(['Timestamp', 'Chat', 'Absender', 'Message_Length'], store)
+    chunk = {'Timestamp': df['Timestamp'].to_numpy().view(np.int64), 'Chat': df['Chat'].cat.codes.to_numpy(),
+             'Absender': df['Absender'].cat.codes.to_numpy(), 'Message_Length': df['Message_Length'].to_numpy()}
+    return rollup_frame(name, *rollup_partial(chunk, name, max(len(meta['senders']), 1)), meta)
+
+def load_stored_rollup(name, store):
+    meta = load_store_meta(store)
+    rollups = message_cache.setdefault('rollups', {})
+    if name not in rollups:
+        with instrument('load rollup ' + name), np.load(os.path.join(store, 'rollup_' + name + '.npz')) as data:
+            rollup = pd.DataFrame({
+                'Chat': pd.Categorical.from_codes(data['Chat'], categories=meta['chats']),
+                'Absender': pd.Categorical.from_codes(data['Absender'], categories=meta['senders']),
+            })
+            for column in data.files:
+                if column not in ('Chat', 'Absender'):
+                    rollup[column] = data[column]
+        if name == 'month':
+            rollup['Month'] = rollup['Month'].to_numpy().astype('datetime64[M]').astype('datetime64[ns]')
+        rollup['Is_Owner'] = rollup['Absender'] == meta['owner_name']
+        rollups[name] = rollup
+    return rollups[name]
+
+#--------------------------------------------
+#Chunked analysis for stores larger than RAM (CHAT_ANALYZER_CHUNK_MB=<MB> or --chunk-mb):
+#the columns are memory mapped and aggregated batch by batch into mergeable partial results
+#--------------------------------------------
+
+chunk_memory = int(os.environ.get('CHAT_ANALYZER_CHUNK_MB', '0')) << 20  # 0 = whole columns in memory
+COLUMN_BYTES = {'Timestamp': 8, 'Chat': 4, 'Absender': 4, 'Is_Owner': 1, 'Message_Length': 4}
+CHUNK_OVERHEAD = 8  # int64 keys, masks and sort buffers per row while a batch is aggregated
+MONTH_OFFSET = 1200  # months are keyed from 1870-01 ...
+MONTH_BUCKETS = 4800  # ... to 2269-12
+
+def iter_store_chunks(columns, store=None, memory=None):
+    # Copies of at most memory bytes (including the aggregation temporaries) per batch
+    store = store or store_folder
+    meta = load_store_meta(store)
+    memory = memory or chunk_memory
+    chunk_rows = max(memory // (CHUNK_OVERHEAD * sum(COLUMN_BYTES[column] for column in columns)), 1)
+    arrays = {column: np.load(os.path.join(store, column + '.npy'), mmap_mode='r') for column in columns}
+    for start in range(0, meta['rows'], chunk_rows):
+        yield {column: np.array(values[start:start + chunk_rows]) for column, values in arrays.items()}
+
+def rollup_partial(chunk, name, sender_count):
+    # Same keys as save_rollups, but with a fixed month range so partials of all batches line up
+    valid = chunk['Timestamp'] != np.iinfo(np.int64).min  # NaT
+    timestamps = chunk['Timestamp'][valid].view('datetime64[ns]')
+    chat_sender = chunk['Chat'][valid].astype(np.int64) * sender_count + chunk['Absender'][valid]
+    if name == 'month':
+        buckets = timestamps.astype('datetime64[M]').astype(np.int64) + MONTH_OFFSET
+        keys = chat_sender * MONTH_BUCKETS + buckets
+    else:
+        days = timestamps.astype('datetime64[D]')
+        hours = (timestamps - days).astype('timedelta64[h]').astype(np.int64)
+        keys = (chat_sender * 24 + hours) * 7 + (days.astype(np.int64) + 3) % 7
+    return rollup_counts(keys, chunk['Message_Length'][valid])
+
+def chunk_filter_mask(chunk, filters, meta):
+    # filter_mask on the raw codes and int64 timestamps of one batch
+    mask = np.ones(len(chunk['Timestamp']), dtype=bool)
+    if 'chats' in filters:
+        mask &= np.isin(chunk['Chat'], [meta['chats'].index(chat) for chat in filters['chats'] if chat in meta['chats']])
+    if 'senders' in filters:
+        mask &= np.isin(chunk['Absender'], [meta['senders'].index(sender) for sender in filters['senders'] if sender in meta['senders']])
+    if 'since' in filters:
+        mask &= chunk['Timestamp'] >= pd.Timestamp(filters['since']).value
+    if 'until' in filters:
+        mask &= chunk['Timestamp'] < pd.Timestamp(filters['until']).value
+    return mask
+
+def chunked_rollup(name, store=None, filters=None):
+    # The rollup frame of load_rollup, computed from the raw columns with bounded memory
+    meta = load_store_meta(store)
+    sender_count = max(len(meta['senders']), 1)
+    keys, counts, characters = np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.int64)
+    for chunk in iter_store_chunks(['Timestamp', 'Chat', 'Absender', 'Message_Length'], store):
+        if filters:
+            mask = chunk_filter_mask(chunk, filters, meta)
+            chunk = {column: values[mask] for column, values in chunk.items()}
+        partial = rollup_partial(chunk, name, sender_count)
+        # The merged result has one row per key, its size does not grow with the number of messages
+        keys, counts, characters = rollup_counts(np.concatenate([keys, partial[0]]), np.concatenate([characters, partial[2]]),
+                                                 np.concatenate([counts, partial[1]]))
+    return rollup_frame(name, keys, counts, characters, meta)
+
+def rollup_frame(name, keys, counts, characters, meta):
+    # Rollup frame (as load_rollup returns it) from the fixed-range keys of rollup_partial
+    sender_count = max(len(meta['senders']), 1)
+    if name == 'month':
+        chat_sender = keys // MONTH_BUCKETS
+        columns = {'Month': (keys % MONTH_BUCKETS - MONTH_OFFSET).astype('datetime64[M]').astype('datetime64[ns]')}
+    else:
+        chat_sender = keys // 7 // 24
+        columns = {'Hour': keys // 7 % 24, 'Weekday': keys % 7}
+    rollup = pd.DataFrame({
+        'Chat': pd.Categorical.from_codes(chat_sender // sender_count, categories=meta['chats']),
+        'Absender': pd.Categorical.from_codes(chat_sender % sender_count, categories=meta['senders']),
+        **columns,
+        'Message_Count': counts,
+        'Character_Count': characters,
+    })
+    rollup['Is_Owner'] = rollup['Absender'] == meta['owner_name']
+    return rollup
+
+def chunked_answer_deviation(chat_filter, store=None):
+    # Walked chat by chat like answer_deviation_data: the running sum of every chat is carried from batch
+    # to batch and the chats are chained at the end. Only the walk at the last message of every chat and
+    # day is kept, so the result grows with days, not with messages.
+    meta = load_store_meta(store)
+    codes = [meta['chats'].index(chat) for chat in chat_filter if chat in meta['chats']]
+    chat_ranks = np.argsort(np.argsort(meta['chats']))
+    walk_ends = np.zeros(len(meta['chats']), np.int64)
+    parts = []
+    for chunk in iter_store_chunks(['Chat', 'Timestamp', 'Is_Owner'], store):
+        selected = np.isin(chunk['Chat'], codes)
+        order = np.argsort(chunk['Chat'][selected], kind='stable')
+        chats = chunk['Chat'][selected][order]
+        timestamps = chunk['Timestamp'][selected][order]
+        steps = np.where(chunk['Is_Owner'][selected][order], -1, 1)
+        starts = np.ones(len(chats), dtype=bool)
+        starts[1:] = chats[1:] != chats[:-1]
+        ends = np.ones(len(chats), dtype=bool)
+        ends[:-1] = starts[1:]
+        # Cumulative sum restarted at every chat, continued from where the chat stopped in the previous batch
+        walk = steps.cumsum()
+        first = np.maximum.accumulate(np.where(starts, np.arange(len(chats)), 0))
+        walk = walk - walk[first] + steps[first] + walk_ends[chats]
+        walk_ends[chats[ends]] = walk[ends]
+        days = timestamps // (86400 * 10**9)
+        last = ends.copy()
+        last[:-1] |= days[1:] != days[:-1]
+        parts.append((chats[last], days[last], timestamps[last], walk[last]))
+
+    chats, days, timestamps, walk = (np.concatenate([part[i] for part in parts]) if parts else np.zeros(0, np.int64) for i in range(4))
+    order = np.argsort(chat_ranks[chats], kind='stable')
+    chats, days, timestamps, walk = chats[order], days[order], timestamps[order], walk[order]
+    # A chat day can span two batches, its first part is dropped here
+    last = np.ones(len(walk), dtype=bool)
+    last[:-1] = (chats[1:] != chats[:-1]) | (days[1:] != days[:-1])
+    # Every chat continues from the end of the chats before it (by name)
+    by_name = np.argsort(chat_ranks)
+    chat_offsets = np.zeros(len(walk_ends), np.int64)
+    chat_offsets[by_name] = np.cumsum(walk_ends[by_name]) - walk_ends[by_name]
+    walk = walk + chat_offsets[chats]
+    return pd.DataFrame({'Timestamp': timestamps[last].view('datetime64[ns]'), 'random_walk': walk[last]})
+
+#--------------------------------------------
+#Full-text search (SQLite FTS5 index in <store>/search.db, kept up to date by prepare_data)
+#and word/bigram counts per chat for the top words mode
+#--------------------------------------------
+
+SEARCH_INDEX_FILE = 'search.db'
+SEARCH_BATCH_ROWS = 100000
+SEARCH_MAX_MONTHS = 120  # longer date ranges are only checked row by row
+TERMS_VERSION = 2  # bumped whenever TOKEN_PATTERN changes, older indexes are rebuilt
+# Words keep inner apostrophes ("geht's", "don’t"), '\n' separates messages
+TOKEN_PATTERN = re.compile(r"\w+(?:['’]\w+)*|\n")
+# Frequent words that say nothing about a chat, skipped in the top words mode (still searchable)
+STOP_WORDS = {"ich", "du", "und", "die", "der", "das", "ist", "nicht", "es", "ja", "in", "zu", "auch", "mit", "aber",
+              "so", "ein", "eine", "dann", "den", "da", "wir", "hast", "bin", "mal", "was", "auf", "noch", "hab", "habe",
+              "mir", "dich", "dir", "mich", "wie", "für", "war", "sie", "er", "schon", "wenn", "doch", "oder", "an",
+              "the", "a", "and", "to", "of", "is", "it", "you", "i", "that", "for", "on", "me", "my", "be",
+              "medien", "ausgeschlossen", "datei", "angehängt"}
+
+SEARCH_INDEX_SCHEMA = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(Nachricht, Tags, Chat UNINDEXED, Absender UNINDEXED, Timestamp UNINDEXED);
+    CREATE TABLE IF NOT EXISTS terms (Chat INTEGER, N INTEGER, Term TEXT, Count INTEGER, PRIMARY KEY (Chat, N, Term)) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS info (Key TEXT PRIMARY KEY, Value INTEGER);
+"""
+
+def open_search_index(store):
+    connection = sqlite3.connect(os.path.join(store, SEARCH_INDEX_FILE))
+    connection.executescript(SEARCH_INDEX_SCHEMA)
+    return connection
+
+def read_store_messages(store, first_row, last_row):
+    # Nachricht of the rows [first_row, last_row) without reading the rest of Nachricht.txt
+    offsets = np.load(os.path.join(store, 'Nachricht_offsets.npy'), mmap_mode='r')
+    with open(os.path.join(store, 'Nachricht.txt'), 'rb') as f:
+        f.seek(int(offsets[first_row]))
+        text = f.read(int(offsets[last_row] - offsets[first_row]))
+    return text.decode('utf-8').split('\n')[:last_row - first_row]
+
+def term_counts(chats, messages):
+    # Word and bigram counts per (Chat, N, Term) for one batch. The messages of a chat are tokenized in one go,
+    # the '\n' tokens between them keep bigrams from spanning two messages. Tokens are factorized to integer ids,
+    # so words and bigrams are counted with numpy instead of a Counter over every token (pair).
+    counts = {}
+    messages = np.array(messages, dtype=object)
+    for chat in np.unique(chats).tolist():
+        token_ids, vocabulary = pd.factorize(pd.Series(TOKEN_PATTERN.findall('\n'.join(messages[chats == chat]).lower()), dtype=object))
+        vocabulary = vocabulary.tolist()
+        is_word = np.array([term != '\n' for term in vocabulary], dtype=bool)
+        for term_id, count in enumerate(np.bincount(token_ids, minlength=len(vocabulary)).tolist()):
+            if is_word[term_id]:
+                counts[(chat, 1, vocabulary[term_id])] = count
+        pairs = token_ids[:-1].astype(np.int64) * len(vocabulary) + token_ids[1:]
+        pairs, pair_counts = np.unique(pairs[is_word[token_ids[:-1]] & is_word[token_ids[1:]]], return_counts=True)
+        for pair, count in zip(pairs.tolist(), pair_counts.tolist()):
+            counts[(chat, 2, vocabulary[pair // len(vocabulary)] + ' ' + vocabulary[pair % len(vocabulary)])] = count
+    return counts
+
+def search_tags(chats, senders, timestamps):
+    # Chat, sender and month as tokens of the indexed Tags column, so these filters are answered by the index
+    months = timestamps.view('datetime64[ns]').astype('datetime64[M]').astype(str)
+    return [f"c{chat} s{sender}" + (" m" + month.replace('-', '') if month != 'NaT' else "")
+            for chat, sender, month in zip(chats.tolist(), senders.tolist(), months.tolist())]
+
+def update_search_index(store=None, parts=None):
+    # Indexes the rows added since the last call (all rows after the store was rebuilt).
+    # parts: the store parts of exactly these rows, their 'terms' were counted by the ingest workers.
+    # Without them the rows are tokenized here. Incremental runs only pay for their new rows.
+    store = store or store_folder
+    meta = load_store_meta(store)
+    with contextlib.closing(open_search_index(store)) as connection, connection:
+        info = dict(connection.execute("SELECT Key, Value FROM info"))
+        indexed_rows = info.get('rows', 0)
+        if info.get('terms_version', 1) != TERMS_VERSION:
+            # Built by an older version: recreated from scratch
+            connection.executescript("DROP TABLE messages; DROP TABLE terms; DELETE FROM info;" + SEARCH_INDEX_SCHEMA)
+            indexed_rows = 0
+        elif indexed_rows > meta['rows']:
+            connection.executescript("DELETE FROM messages; DELETE FROM terms;")
+            indexed_rows = 0
+        if indexed_rows == meta['rows']:
+            return 0
+
+        counted = parts is not None and all('terms' in part for part in parts) and sum(part['rows'] for part in parts) == meta['rows'] - indexed_rows
+        with instrument('search index', meta['rows'] - indexed_rows):
+            columns = {column: np.load(os.path.join(store, column + '.npy'), mmap_mode='r') for column in ('Chat', 'Absender', 'Timestamp')}
+            for first_row in range(indexed_rows, meta['rows'], SEARCH_BATCH_ROWS):
+                last_row = min(first_row + SEARCH_BATCH_ROWS, meta['rows'])
+                messages = read_store_messages(store, first_row, last_row)
+                chats, senders, timestamps = (np.array(columns[column][first_row:last_row]) for column in ('Chat', 'Absender', 'Timestamp'))
+                connection.executemany("INSERT INTO messages (rowid, Nachricht, Tags, Chat, Absender, Timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                                       zip(range(first_row, last_row), messages, search_tags(chats, senders, timestamps),
+                                           chats.tolist(), senders.tolist(), timestamps.tolist()))
+                if not counted:
+                    connection.executemany("INSERT INTO terms VALUES (?, ?, ?, ?) ON CONFLICT DO UPDATE SET Count = Count + excluded.Count",
+                                           ((chat, n, term, count) for (chat, n, term), count in term_counts(chats, messages).items()))
+            for part in parts if counted else []:
+                # The part's chat codes mapped to the store's
+                chat_codes = pd.Index(meta['chats']).get_indexer(part['chats']).tolist()
+                connection.executemany("INSERT INTO terms VALUES (?, ?, ?, ?) ON CONFLICT DO UPDATE SET Count = Count + excluded.Count",
+                                       ((chat_codes[chat], n, term, count) for (chat, n, term), count in part['terms'].items()))
+            connection.execute("INSERT OR REPLACE INTO info VALUES ('rows', ?)", (meta['rows'],))
+            connection.execute("INSERT OR REPLACE INTO info VALUES ('terms_version', ?)", (TERMS_VERSION,))
+    return meta['rows'] - indexed_rows
+
+def fts_query(text):
+    # Words are matched as keywords (all of them), "quoted text" as a phrase; FTS5 operators are not interpreted
+    tokens = re.findall(r'"([^"]*)"|(\S+)', text)
+    return ' '.join('"' + (phrase or word).replace('"', '""') + '"' for phrase, word in tokens if (phrase or word).strip())
+
+def search_messages(query, chats=None, senders=None, since=None, until=None, limit=100, store=None):
+    # Messages matching query, optionally only in these chats/from these senders and in [since, until)
+    store = store or store_folder
+    meta = load_store_meta(store)
+    match = "Nachricht : (" + (fts_query(query) or '""') + ")"
+    for prefix, names, categories in (('c', chats, meta['chats']), ('s', senders, meta['senders'])):
+        if names:
+            match += " AND Tags : (" + (" OR ".join(prefix + str(categories.index(name)) for name in names if name in categories) or "none") + ")"
+    conditions = []
+    parameters = []
+    if since is not None:
+        conditions.append("Timestamp >= ?")
+        parameters.append(pd.Timestamp(since).value)
+    if until is not None:
+        conditions.append("Timestamp < ?")
+        parameters.append(pd.Timestamp(until).value)
+    if since is not None or until is not None:
+        # The months of the range narrow the matches in the index, the exact bounds are checked on the rest.
+        # An open end is closed with the first or last month of the store.
+        stored_months = load_rollup('month', store)['Month']
+        months = pd.period_range(pd.Timestamp(since) if since is not None else stored_months.min(),
+                                 pd.Timestamp(until) if until is not None else stored_months.max(), freq='M')
+        if len(months) <= SEARCH_MAX_MONTHS:
+            match += " AND Tags : (" + (" OR ".join("m" + month.strftime('%Y%m') for month in months) or "none") + ")"
+
+    with instrument('search'), contextlib.closing(open_search_index(store)) as connection:
+        rows = connection.execute("SELECT rowid, Chat, Absender, Timestamp, Nachricht FROM messages WHERE "
+                                  + " AND ".join(["messages MATCH ?"] + conditions) + " ORDER BY rowid LIMIT ?",
+                                  [match] + parameters + [limit]).fetchall()
+    results = pd.DataFrame(rows, columns=['Row', 'Chat', 'Absender', 'Timestamp', 'Nachricht'])
+    results['Chat'] = pd.Categorical.from_codes(results['Chat'].astype(np.int32), categories=meta['chats'])
+    results['Absender'] = pd.Categorical.from_codes(results['Absender'].astype(np.int32), categories=meta['senders'])
+    results['Timestamp'] = pd.to_datetime(results['Timestamp'].astype(np.int64))
+    return results
+
+def top_terms(chat_filter, n, limit=20, store=None):
+    # Most frequent words (n=1) or bigrams (n=2) in the selected chats, read from the counts in the index
+    store = store or store_folder
+    meta = load_store_meta(store)
+    codes = [meta['chats'].index(chat) for chat in chat_filter if chat in meta['chats']]
+    with contextlib.closing(open_search_index(store)) as connection:
+        rows = connection.execute("SELECT Term, SUM(Count) AS Total FROM terms WHERE N = ? AND Chat IN (" + ", ".join("?" * len(codes)) + ")"
+                                  " GROUP BY Term ORDER BY Total DESC, Term", [n] + codes)
+        return select_terms(rows, limit)
+
+def filtered_top_terms(limit=20, store=None):
+    # (words, bigrams) of the rows that pass the active filters. The counts in the index are per chat only,
+    # with sender or date filters the rows are tokenized now (all chats together, the '\n' between messages stays)
+    df = load_messages(['Chat', 'Nachricht'], store)
+    counts = term_counts(np.zeros(len(df), np.int64), df['Nachricht'].tolist())
+    return tuple(select_terms(sorted(((term, count) for (_, term_n, term), count in counts.items() if term_n == n), key=lambda item: (-item[1], item[0])), limit)
+                 for n in (1, 2))
+
+def select_terms(term_totals, limit):
+    # The first limit (term, total) pairs, most frequent first (ties by term)
+    terms = []
+    for term, total in term_totals:
+        words = term.split(' ')
+        # Skip stop words and numbers; a bigram is kept unless both of its words are stop words
+        if all(word in STOP_WORDS or word.isdigit() or len(word) < 2 for word in words):
+            continue
+        terms.append((term, total))
+        if len(terms) == limit:
+            break
+    return pd.Series(dict(terms), dtype=np.int64)
+
+#--------------------------------------------
+#Media inventory: names and sizes from the ZIP central directory (no payload is read),
+#attributed to senders through the attachment messages found with the search index
+#--------------------------------------------
+
+MEDIA_INVENTORY_FILE = 'media.json'
+# WhatsApp name prefixes (Android "IMG-20240131-WA0001.jpg", iOS "00000012-PHOTO-2024-01-31-10-00-00.jpg")
+MEDIA_PREFIXES = {'IMG': 'image', 'PHOTO': 'image', 'VID': 'video', 'VIDEO': 'video', 'PTT': 'audio', 'AUD': 'audio',
+                  'AUDIO': 'audio', 'STK': 'sticker', 'STICKER': 'sticker'}
+MEDIA_EXTENSIONS = {'jpg': 'image', 'jpeg': 'image', 'png': 'image', 'gif': 'image', 'heic': 'image',
+                    'mp4': 'video', 'mov': 'video', '3gp': 'video', 'mkv': 'video',
+                    'opus': 'audio', 'ogg': 'audio', 'm4a': 'audio', 'mp3': 'audio', 'aac': 'audio', 'amr': 'audio',
+                    'webp': 'sticker'}
+MEDIA_TYPES = ['image', 'video', 'audio', 'sticker', 'other', 'omitted']
+MEDIA_NAME_PATTERN = re.compile(r"(?:^|-)(IMG|PHOTO|VID|VIDEO|PTT|AUD|AUDIO|STK|STICKER)-(?:(\d{8})-|(\d{4}-\d{2}-\d{2})-)?")
+# "IMG-20240131-WA0001.jpg (Datei angehängt)", "<Anhang: 00000012-PHOTO-….jpg>", "<Medien ausgeschlossen>"
+ATTACHMENT_PATTERN = re.compile(r"\u200e?(?:<(?:Anhang|attached): ([^>]+)>|(\S+\.\w+) \((?:Datei angehängt|file attached)\))")
+OMITTED_PATTERN = re.compile(r"\u200e?(?:<Medien ausgeschlossen>|<Media omitted>|(?:Bild|Video|Audio|Sticker|GIF|image|video|audio|sticker) (?:weggelassen|omitted))")
+ATTACHMENT_QUERY = ('Nachricht : ("Datei angehängt" OR "file attached" OR "Anhang" OR "attached" OR "Medien ausgeschlossen"'
+                    ' OR "Media omitted" OR "weggelassen" OR "omitted")')
+
+def media_type(file_name):
+    match = MEDIA_NAME_PATTERN.search(file_name)
+    if match:
+        return MEDIA_PREFIXES[match.group(1)]
+    return MEDIA_EXTENSIONS.get(os.path.splitext(file_name)[1][1:].lower(), 'other')
+
+def scan_archive_media(file_path):
+    # (file name, bytes, month) for every media file in the archive, month from the name or the ZIP entry date
+    media = []
+    with zipfile.ZipFile(file_path, 'r') as zip_ref:
+        for member in zip_ref.infolist():
+            if member.is_dir() or member.filename.endswith('.txt'):
+                continue
+            file_name = os.path.basename(member.filename)
+            match = MEDIA_NAME_PATTERN.search(file_name)
+            date = match and (match.group(2) or (match.group(3) or '').replace('-', ''))
+            month = date[:4] + '-' + date[4:6] if date else f"{member.date_time[0]:04d}-{member.date_time[1]:02d}"
+            media.append((file_name, member.file_size, month))
+    return media
+
+def write_media_inventory(data_folder, manifest, store=None):
+    # Rescanned on every prepare_data, reading a central directory takes milliseconds even for huge exports
+    store = store or store_folder
+    inventory = []
+    with instrument('media inventory') as stage:
+        for file_name, entry in manifest.items():
+            file_path = os.path.join(data_folder, file_name)
+            if os.path.exists(file_path) and zipfile.is_zipfile(file_path):
+                inventory.extend([entry['label'], *media] for media in scan_archive_media(file_path))
+        stage['rows'] = len(inventory)
+    with open(os.path.join(store, MEDIA_INVENTORY_FILE), 'w', encoding='utf-8') as f:
+        json.dump(inventory, f, ensure_ascii=False)
+
+def attachment_messages(store=None):
+    # Attachment and omitted media messages; only the index hits are matched against the patterns
+    store = store or store_folder
+    meta = load_store_meta(store)
+    with contextlib.closing(open_search_index(store)) as connection:
+        rows = connection.execute("SELECT Chat, Absender, Timestamp, Nachricht FROM messages WHERE messages MATCH ?", [ATTACHMENT_QUERY]).fetchall()
+    attachments = []
+    for chat, sender, timestamp, message in rows:
+        match = ATTACHMENT_PATTERN.match(message)
+        if match:
+            attachments.append((meta['chats'][chat], meta['senders'][sender], timestamp, (match.group(1) or match.group(2)).strip()))
+        elif OMITTED_PATTERN.match(message):
+            attachments.append((meta['chats'][chat], meta['senders'][sender], timestamp, None))
+    attachments = pd.DataFrame(attachments, columns=['Chat', 'Absender', 'Timestamp', 'File'])
+    attachments['Timestamp'] = pd.to_datetime(attachments['Timestamp'].astype(np.int64))
+    return attachments
+
+def load_media(store=None):
+    # One row per media file or omitted media message: Chat, File, Type, Bytes, Month, Absender
+    store = store or store_folder
+    inventory_file = os.path.join(store, MEDIA_INVENTORY_FILE)
+    inventory = []
+    if os.path.exists(inventory_file):
+        with open(inventory_file, 'r', encoding='utf-8') as f:
+            inventory = json.load(f)
+    media = pd.DataFrame(inventory, columns=['Chat', 'File', 'Bytes', 'Month'])
+    attachments = attachment_messages(store)
+
+    # Files are attributed to the sender of the message that references them
+    references = attachments[attachments['File'].notna()].drop_duplicates(['Chat', 'File'])
+    media = media.merge(references, on=['Chat', 'File'], how='left')
+    media['Absender'] = media['Absender'].fillna('Unknown')
+    media['Month'] = media['Timestamp'].dt.to_period('M').dt.to_timestamp().fillna(pd.to_datetime(media['Month'], format='%Y-%m'))
+    media['Type'] = [media_type(file_name) for file_name in media['File']]
+
+    omitted = attachments[attachments['File'].isna()]
+    omitted = pd.DataFrame({'Chat': omitted['Chat'], 'File': None, 'Bytes': 0,
+                            'Month': omitted['Timestamp'].dt.to_period('M').dt.to_timestamp(),
+                            'Absender': omitted['Absender'], 'Type': 'omitted'})
+    media = pd.concat([media.drop(columns='Timestamp'), omitted], ignore_index=True)
+    media['Type'] = pd.Categorical(media['Type'], categories=MEDIA_TYPES)
+    return media
+
+# Emoji als Graphem-Cluster: Flaggen, Keycaps, Hautfarben, ZWJ-Sequenzen (Familien etc.) zählen als ein Emoji
+EMOJI_BASE = ("[\U0001F300-\U0001F5FF\U0001F600-\U0001F64F\U0001F680-\U0001F6FF\U0001F700-\U0001FAFF"
+              "\U0001F004\U0001F0CF\U0001F170-\U0001F1E5\U0001F200-\U0001F251"
+              "\u2300-\u23FF\u2600-\u27BF\u2B00-\u2BFF\u2934\u2935\u3030\u303D\u3297\u3299]")
+# Symbols that are only emoji in emoji presentation (followed by U+FE0F)
+EMOJI_TEXT_SYMBOL = "[\u00A9\u00AE\u203C\u2049\u2122\u2139\u2194-\u2199\u21A9\u21AA\u24C2\u25AA\u25AB\u25B6\u25C0\u25FB-\u25FE]\uFE0F"
+EMOJI_ELEMENT = "(?:" + EMOJI_BASE + "\uFE0F?[\U0001F3FB-\U0001F3FF]?[\U000E0020-\U000E007F]*|" + EMOJI_TEXT_SYMBOL + ")"
+EMOJI_PATTERN = re.compile("[\U0001F1E6-\U0001F1FF]{2}|[0-9#*]\uFE0F?\u20E3|" + EMOJI_ELEMENT + "(?:\u200D" + EMOJI_ELEMENT + ")*")
+
+def count_emojis(df, by=('Chat', 'Absender')):
+    # One findall over the concatenated text of each group instead of a Python loop per character
+    rows = []
+    with instrument('aggregation: emoji', len(df)):
+        for keys, messages in df.groupby(list(by), observed=True)['Nachricht']:
+            keys = keys if isinstance(keys, tuple) else (keys,)
+            # "❤️" and "❤" are the same emoji, the variation selector U+FE0F only picks the presentation
+            counts = Counter()
+            for emoji, count in Counter(EMOJI_PATTERN.findall('\n'.join(messages))).items():
+                counts[emoji.replace('\uFE0F', '')] += count
+            for emoji, count in counts.items():
+                rows.append((*keys, emoji, count))
+    return pd.DataFrame(rows, columns=[*by, 'Emoji', 'Count'])
+
+def message_hashes(messages):
+    # Stable 64 bit key per message text (Python's hash() changes between runs)
+    return np.array([int.from_bytes(hashlib.blake2b(message.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+                     for message in messages], dtype=np.int64)
+
+def score_sentiment_batch(messages):
+    from textblob import TextBlob
+    # One TextBlob per message for both values
+    scores = np.empty((len(messages), 2), dtype=np.float64)
+    for i, message in enumerate(messages):
+        sentiment = TextBlob(message).sentiment
+        scores[i] = (sentiment.polarity, sentiment.subjectivity)
+    return scores
+
+SENTIMENT_CACHE_FILE = 'sentiment.npz'
+
+def load_sentiment_cache(cache_folder):
+    # A missing, unreadable or inconsistent cache counts as empty, the scores are simply computed again
     try:
-        # Check if the character is in a known emoji Unicode range
-        # Unicode ranges for emojis
-        if '\U0001F600' <= character <= '\U0001F64F' or \
-           '\U0001F300' <= character <= '\U0001F5FF' or \
-           '\U0001F680' <= character <= '\U0001F6FF' or \
-           '\U0001F700' <= character <= '\U0001F77F' or \
-           '\U0001F780' <= character <= '\U0001F7FF' or \
-           '\U0001F800' <= character <= '\U0001F8FF' or \
-           '\U0001F900' <= character <= '\U0001F9FF' or \
-           '\U0001FA00' <= character <= '\U0001FA6F' or \
-           '\U0001FA70' <= character <= '\U0001FAFF' or \
-           '\U00002702' <= character <= '\U000027B0' or \
-           '\U000024C2' <= character <= '\U0001F251':
-            return True
-        return False
-    except TypeError:
-        return False
+        with np.load(os.path.join(cache_folder, SENTIMENT_CACHE_FILE)) as cache:
+            keys, scores = cache['keys'], cache['scores']
+        if len(keys) == len(scores):
+            return keys, scores
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        pass
+    return np.empty(0, dtype=np.int64), np.empty((0, 2), dtype=np.float64)
+
+def save_sentiment_cache(cache_folder, keys, scores):
+    # Keys and scores in one file, swapped in atomically: several processes (server pool workers) may write
+    # at the same time, the last one wins and readers never see a half written cache
+    os.makedirs(cache_folder, exist_ok=True)
+    tmp_file = os.path.join(cache_folder, f'{SENTIMENT_CACHE_FILE}.{os.getpid()}.{threading.get_ident()}.tmp')
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, keys=keys, scores=scores)
+    os.replace(tmp_file, os.path.join(cache_folder, SENTIMENT_CACHE_FILE))
+
+def sentiment_scores(messages, workers=None, cache_folder=None, batch_size=2000):
+    # Polarity/subjectivity per message. Scores are cached on disk by message hash,
+    # only texts that were never scored before go through TextBlob (in batches across a process pool).
+    # A cancelled background job stops between batches (CancelledError), the batches scored so far are cached.
+    cache_folder = cache_folder or sentiment_cache_folder
+    unique_messages = pd.unique(np.asarray(messages, dtype=object))
+    keys = message_hashes(unique_messages)
+
+    cached_keys, cached_scores = load_sentiment_cache(cache_folder)
+    positions = pd.Index(cached_keys).get_indexer(keys)
+    missing = np.flatnonzero(positions < 0)
+    if len(missing):
+        batches = [unique_messages[missing[i:i + batch_size]] for i in range(0, len(missing), batch_size)]
+        new_scores = []
+        if len(batches) > 1 and workers != 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(score_sentiment_batch, batch) for batch in batches]
+                for future in futures:
+                    if job_cancelled():
+                        for pending in futures:
+                            pending.cancel()
+                        break
+                    new_scores.append(future.result())
+        else:
+            for batch in batches:
+                if job_cancelled():
+                    break
+                new_scores.append(score_sentiment_batch(batch))
+
+        scored = missing[:sum(len(batch_scores) for batch_scores in new_scores)]
+        positions[scored] = np.arange(len(cached_keys), len(cached_keys) + len(scored))
+        cached_keys = np.concatenate([cached_keys, keys[scored]])
+        cached_scores = np.concatenate([cached_scores] + new_scores)
+        if len(scored):
+            save_sentiment_cache(cache_folder, cached_keys, cached_scores)
+        if len(scored) < len(missing):
+            raise CancelledError()
+
+    # Map back from the unique texts to every message
+    scores = cached_scores[positions][pd.Index(unique_messages).get_indexer(messages)]
+    return pd.DataFrame({'Polarity': scores[:, 0], 'Subjectivity': scores[:, 1]})
+
+def load_sentiment(store=None, workers=None):
+    # Sentiment for every stored message, kept in the session cache next to the loaded columns
+    load_store_meta(store)
+    if 'sentiment' not in message_cache:
+        # Scored for all rows, the analysis filters select from them by row
+        with filtered_analysis():
+            messages = load_messages(['Nachricht'], store)['Nachricht']
+        message_cache['sentiment'] = sentiment_scores(messages, workers)
+    return message_cache['sentiment']
 
 def choose_users():
     users = []
@@ -168,67 +1423,110 @@ def choose_users():
         for i in range(len(users)):
             users[i] = users[i].strip()
     else:
-        users = pd.read_csv('all_chats.csv')['Chat'].unique()
+        users = load_store_meta()['chats']
     return users
 
-#Analysis functions 
-def analyse_message_amount():
-    #Make bar chart of message amount
-    df = pd.read_csv('all_chats.csv')
-
-    df_other = df[df['Absender'] != owner_name]
-    df_owner = df[df['Absender'] == owner_name]
-
-    # Count the number of messages for each sender
-    message_counts_other = df_other['Chat'].value_counts()
-    message_counts_owner = df_owner['Chat'].value_counts()
+#--------------------------------------------
+#Decimated line plots: at most two points (min and max) per pixel column are drawn,
+#zooming or panning re-decimates the visible range from the full series
+#--------------------------------------------
 
-    # Create a bar chart
+def decimate_min_max(values, buckets):
+    # Indices of the first, last and the min/max point of each of the buckets equal-sized index ranges
+    if len(values) <= 2 * buckets:
+        return np.arange(len(values))
+    bucket_size = -(-len(values) // buckets)
+    # Padding with the last value does not change any bucket's min or max
+    padded = np.concatenate([values, np.full(bucket_size * buckets - len(values), values[-1])]).reshape(buckets, bucket_size)
+    offsets = np.arange(buckets) * bucket_size
+    indices = np.concatenate([[0, len(values) - 1], offsets + padded.argmin(axis=1), offsets + padded.argmax(axis=1)])
+    return np.unique(np.minimum(indices, len(values) - 1))
+
+def plot_decimated(ax, x, y, **kwargs):
+    # Line plot of a (datetime) series whose drawn point count depends on the axes width, not on len(y)
+    import matplotlib.dates as mdates
+    x = np.asarray(x)
+    y = np.asarray(y)
+    x_numbers = mdates.date2num(x) if np.issubdtype(x.dtype, np.datetime64) else x.astype(float)
+
+    def visible_points():
+        buckets = max(int(ax.bbox.width), 1)
+        low, high = ax.get_xlim()
+        visible = (x_numbers >= low) & (x_numbers <= high)
+        # One point beyond each edge, so the line runs to the border of the axes
+        visible[1:] |= visible[:-1].copy()
+        visible[:-1] |= visible[1:].copy()
+        selected = np.flatnonzero(visible)
+        return selected[decimate_min_max(y[selected], buckets)]
+
+    selected = decimate_min_max(y, max(int(ax.bbox.width), 1))
+    line, = ax.plot(x[selected], y[selected], **kwargs)
+
+    def on_xlim_changed(ax):
+        selected = visible_points()
+        line.set_data(x[selected], y[selected])
+
+    ax.callbacks.connect('xlim_changed', on_xlim_changed)
+    return line
+
+#Analysis functions
+#Each mode has a *_data function (plain numbers, safe to run in a background thread)
+#and a plot_* function that draws the result on the main thread.
+def analysed_chats(per_chat, chat_filter):
+    # Groupbys with observed=False have a row for every chat of the store (0 or NaN outside the filter),
+    # only the analysed chats are kept, in store order
+    return per_chat if chat_filter is None else per_chat[per_chat.index.isin(chat_filter)]
+
+def message_amount_data(chat_filter=None):
+    df = load_rollup('month')
+
+    df_other = df[~df['Is_Owner']]
+    df_owner = df[df['Is_Owner']]
+
+    # Count the number of messages for each sender (same chat order for both, so the bars stack)
+    message_counts_other = df_other.groupby('Chat', observed=False)['Message_Count'].sum()
+    message_counts_owner = df_owner.groupby('Chat', observed=False)['Message_Count'].sum()
+    return {'other': analysed_chats(message_counts_other, chat_filter), 'owner': analysed_chats(message_counts_owner, chat_filter),
+            'owner_name': current_owner()}
+
+def plot_message_amount(data):
+    import matplotlib.pyplot as plt
+    #Make bar chart of message amount
     fig, ax = plt.subplots(figsize=(10, 6))
-    
-    ax.bar(message_counts_other.index, message_counts_other.values)
-    ax.bar(message_counts_owner.index, message_counts_owner.values, bottom=message_counts_other.values)
+
+    ax.bar(data['other'].index, data['other'].values)
+    ax.bar(data['owner'].index, data['owner'].values, bottom=data['other'].values)
 
     # Add labels and title
     ax.set_xlabel('Chat')
     ax.set_ylabel('Message Count')
     ax.set_title('Message Count by Sender for Each Chat')
 
-    ax.legend(title="Sender", labels=['Other', owner_name])
+    ax.legend(title="Sender", labels=['Other', data['owner_name']])
 
-    # Display the plot
     plt.tight_layout()
-    plt.show()
-
-def analyse_message_frequency():
-    #name = simpledialog.askstring("Input", "Enter the name of the person whose chat you want to analyse:", parent=window)
-    names = choose_users()
-
-    #Read data from all_chats.csv and import into pandas
-    df = pd.read_csv('all_chats.csv')
-
-    # Ensure the 'Datum' (Date) column is in datetime format
-    df['Datum'] = pd.to_datetime(df['Datum'], format='%d.%m.%y')
+    return fig
 
-    # Create a new column that represents two-month intervals
-    df['Two_Month_Interval'] = df['Datum'].apply(lambda x: pd.Timestamp(datetime(x.year, ((x.month-1)//1)*1+1, 1)))
+def message_frequency_data(chat_filter):
+    #Read the monthly rollup (chat x sender x month, built at ingest)
+    df = load_rollup('month')
 
-    # Extract the month and year from the 'Datum' column
-    #df['Month_Year'] = df['Datum'].dt.to_period('M')
+    # Group by 'Month' and 'Chat' and sum up the message counts
+    message_counts = df.groupby(['Month', 'Chat'], observed=True)['Message_Count'].sum().reset_index()
 
-    # Group by 'Month_Year' and 'Absender' (sender) and count the messages
-    message_counts = df.groupby(['Two_Month_Interval', 'Chat']).size().reset_index(name='Message_Count')
+    # Filter the data for the selected chats
+    return message_counts[message_counts['Chat'].isin(chat_filter)]
 
+def plot_message_frequency(message_counts):
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
     # Create a plot for each sender
-    plt.figure(figsize=(10, 6))
-
-    # Filter the data for a specific sender
-    message_counts = message_counts[message_counts['Chat'].isin(names)]
+    fig = plt.figure(figsize=(10, 6))
 
     # We will create a line for each sender showing the number of messages per month
     for sender in message_counts['Chat'].unique():
         sender_data = message_counts[message_counts['Chat'] == sender]
-        plt.plot(sender_data['Two_Month_Interval'], sender_data['Message_Count'], label=sender)
+        plot_decimated(plt.gca(), sender_data['Month'], sender_data['Message_Count'], label=sender)
 
     # Format the x-axis to show the timeline
     plt.gca().xaxis.set_major_locator(mdates.YearLocator())
@@ -245,27 +1543,24 @@ def analyse_message_frequency():
     plt.title('Timeline of Messages by Chat (Fist Message - Present)')
     plt.legend(title='Sender')
 
-    # Display the plot
     plt.tight_layout()
-    plt.show()
-
-def analyse_message_length():
-    #Read data from all_chats.csv and import into pandas
-    df = pd.read_csv('all_chats.csv')
-
-    df['Nachricht'] = df['Nachricht'].astype(str)
+    return fig
 
-    df_other = df[df['Absender'] != owner_name]
-    df_owner = df[df['Absender'] == owner_name]
+def message_length_data(chat_filter=None):
+    #Read the monthly rollup (character totals are summed at ingest)
+    df = load_rollup('month')
 
-    # Calculate the length of each message
-    df_other['Message_Length'] = df_other['Nachricht'].apply(lambda x: len(x))
-    df_owner['Message_Length'] = df_owner['Nachricht'].apply(lambda x: len(x))
+    df_other = df[~df['Is_Owner']].groupby('Chat', observed=False)[['Character_Count', 'Message_Count']].sum()
+    df_owner = df[df['Is_Owner']].groupby('Chat', observed=False)[['Character_Count', 'Message_Count']].sum()
 
-    # Group by 'Absender' (sender) and calculate the average message length
-    avg_message_length_other = df_other.groupby('Chat')['Message_Length'].mean()
-    avg_message_length_owner = df_owner.groupby('Chat')['Message_Length'].mean()
+    # Average message length per chat (one value per chat, in category order)
+    avg_message_length_other = df_other['Character_Count'] / df_other['Message_Count']
+    avg_message_length_owner = df_owner['Character_Count'] / df_owner['Message_Count']
+    return {'other': analysed_chats(avg_message_length_other, chat_filter), 'owner': analysed_chats(avg_message_length_owner, chat_filter),
+            'owner_name': current_owner()}
 
+def plot_grouped_bars(data, ylabel, title):
+    import matplotlib.pyplot as plt
     # Create a figure and axis
     fig, ax = plt.subplots(figsize=(10, 6))
 
@@ -273,103 +1568,186 @@ def analyse_message_length():
     bar_width = 0.35
 
     # Define the x positions for the bars
-    index = np.arange(len(df['Chat'].unique()))
+    chats = data['other'].index
+    index = np.arange(len(chats))
 
     # Plot the bars for Sender1 and Sender2
-    ax.bar(index - bar_width/2, avg_message_length_other.values, bar_width, label='Other')  # Bar for Sender1
-    ax.bar(index + bar_width/2, avg_message_length_owner.values, bar_width, label=owner_name)  # Bar for Sender2
+    ax.bar(index - bar_width/2, data['other'].values, bar_width, label='Other')  # Bar for Sender1
+    ax.bar(index + bar_width/2, data['owner'].values, bar_width, label=data['owner_name'])  # Bar for Sender2
 
     # Add labels and title
     ax.set_xlabel('Chat')
-    ax.set_ylabel('Message Length by Characters')
-    ax.set_title('Message Length by Sender')
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
     ax.set_xticks(index)  # Set x-axis tick positions
-    ax.set_xticklabels(df['Chat'].unique())  # Set x-axis tick labels to the Chat names
+    ax.set_xticklabels(chats)  # Set x-axis tick labels to the Chat names
 
     # Add the legend
     ax.legend(title="Senders")
 
-    # Display the plot
     plt.tight_layout()
-    plt.show()
+    return fig
 
-def analyse_emoji():
-    chat_filter = choose_users()
+def plot_message_length(data):
+    return plot_grouped_bars(data, 'Message Length by Characters', 'Message Length by Sender')
 
-    df = pd.read_csv('all_chats.csv')
+def emoji_data(chat_filter):
+    df = load_messages(['Chat', 'Absender', 'Nachricht'])
 
     df = df[df['Chat'].isin(chat_filter)]
 
-    df['Nachricht'] = df['Nachricht'].astype(str)
-
-    # make a piechart of the type of emojis used
-    emoji_counts = {}
+    # Count the emojis per chat and sender in one pass
+    emoji_counts = count_emojis(df)
 
-    for message in df['Nachricht']:
-        for character in message:
-            if is_emoji(character):
-                if character in emoji_counts:
-                    emoji_counts[character] += 1
-                else:
-                    emoji_counts[character] = 1
-    
     # Sort the emojis by count
-    sorted_emojis = sorted(emoji_counts.items(), key=lambda x: x[1], reverse=True)
-
-    # Create a pie chart
-    plt.figure(figsize=(10, 6))
-    labels = []
-    sizes = []
+    sorted_emojis = emoji_counts.groupby('Emoji')['Count'].sum().sort_values(ascending=False)
+    return {'counts': sorted_emojis, 'chats': list(chat_filter)}
 
-    for emoji, count in sorted_emojis:
-        labels.append(emoji)
-        sizes.append(count)
+def plot_emoji(data):
+    import matplotlib.pyplot as plt
+    # make a piechart of the type of emojis used
+    sorted_emojis = data['counts']
+    fig = plt.figure(figsize=(10, 6))
 
-    # Only show the top 15 emojis
-    labels = labels[:10] + ['Others']
-    sizes = sizes[:10] + [sum(sizes[15:])]
+    # Only show the top 10 emojis
+    labels = list(sorted_emojis.index[:10]) + ['Others']
+    sizes = list(sorted_emojis.values[:10]) + [sorted_emojis.values[10:].sum()]
 
-    plt.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=140, textprops={'fontsize': 14})
+    if sum(sizes):
+        plt.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=140, textprops={'fontsize': 14})
+    else:
+        # No emojis at all (or an empty store) - matplotlib cannot draw an empty pie
+        plt.text(0.5, 0.5, 'No emojis', ha='center', va='center', fontsize=14)
     plt.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
 
     # Add title
-    plt.title('Emoji Distribution in Chat: ' + chat_filter)
+    plt.title('Emoji Distribution in Chat: ' + ', '.join(data['chats']))
 
-    plt.rcParams['font.family'] = 'Segoe UI Emoji' 
+    plt.rcParams['font.family'] = 'Segoe UI Emoji'
 
-    # Display the plot
     plt.tight_layout()
-    plt.show()
-
-def last_message_of_conversation():
-    chat_filter = choose_users()
-
-    df = pd.read_csv('all_chats.csv')
-
-    df = df[df['Chat'].isin(chat_filter)]
-
-    #Group by day and chat
-    df = df.groupby(['Datum'])
+    return fig
+
+# A conversation ends after this much silence in a chat (--conversation-gap)
+conversation_gap_hours = 6.0
+# Reply latency histogram bins in minutes (the last bin is open ended)
+LATENCY_BINS = [0, 1, 5, 15, 60, 180, 720, 1440]
+LATENCY_LABELS = ['<1m', '1-5m', '5-15m', '15-60m', '1-3h', '3-12h', '12-24h', '>24h']
+
+def last_message_of_conversation_data(chat_filter, gap_hours=None):
+    df = load_messages(['Chat', 'Absender', 'Timestamp', 'Is_Owner'])
+
+    df = df[df['Chat'].isin(chat_filter) & df['Timestamp'].notna()]
+
+    # Sort by chat, then time (stable, so messages of the same minute keep their order)
+    chats = df['Chat'].cat.codes.to_numpy()
+    timestamps = df['Timestamp'].to_numpy().view(np.int64)
+    order = np.lexsort((timestamps, chats))
+    chats, timestamps = chats[order], timestamps[order]
+    senders = df['Absender'].cat.codes.to_numpy()[order]
+    is_owner = df['Is_Owner'].to_numpy()[order]
+
+    # A conversation starts at the first message of a chat and after every gap longer than the limit
+    gap = np.timedelta64(int((gap_hours or conversation_gap_hours) * 3600), 's').astype('timedelta64[ns]').astype(np.int64)
+    deltas = np.diff(timestamps)
+    same_chat = chats[1:] == chats[:-1]
+    starts = np.ones(len(chats), dtype=bool)
+    starts[1:] = ~same_chat | (deltas > gap)
+    ends = np.ones(len(chats), dtype=bool)
+    ends[:-1] = starts[1:]
+
+    chat_count = len(df['Chat'].cat.categories)
+    conversations = pd.DataFrame({
+        'Conversations': np.bincount(chats[starts], minlength=chat_count),
+        'Started_Owner': np.bincount(chats[starts & is_owner], minlength=chat_count),
+        'Ended_Owner': np.bincount(chats[ends & is_owner], minlength=chat_count),
+    }, index=df['Chat'].cat.categories)
+    conversations = conversations[conversations.index.isin(chat_filter)]
+    conversations['Started_Other'] = conversations['Conversations'] - conversations['Started_Owner']
+    conversations['Ended_Other'] = conversations['Conversations'] - conversations['Ended_Owner']
+
+    # A reply is a message inside a conversation whose sender differs from the previous message's sender
+    replies = np.zeros(len(chats), dtype=bool)
+    replies[1:] = ~starts[1:] & (senders[1:] != senders[:-1])
+    latency_minutes = np.zeros(len(chats))
+    latency_minutes[1:] = deltas / 60e9
+    reply_senders = senders[replies]
+    reply_minutes = latency_minutes[replies]
+
+    # Histogram per sender: one bincount over sender x bin
+    sender_count = len(df['Absender'].cat.categories)
+    bins = np.digitize(reply_minutes, LATENCY_BINS[1:])
+    histogram = np.bincount(reply_senders * len(LATENCY_LABELS) + bins,
+                            minlength=sender_count * len(LATENCY_LABELS)).reshape(sender_count, len(LATENCY_LABELS))
+    histogram = pd.DataFrame(histogram, index=df['Absender'].cat.categories, columns=LATENCY_LABELS)
+
+    latencies = pd.DataFrame({'Absender': pd.Categorical.from_codes(reply_senders, categories=df['Absender'].cat.categories),
+                              'Minutes': reply_minutes})
+    summary = latencies.groupby('Absender', observed=True)['Minutes'].describe(percentiles=[0.5, 0.9])
+    histogram = histogram.loc[summary.index]
+    return {'conversations': conversations, 'latency': summary, 'histogram': histogram,
+            'owner_name': current_owner(), 'gap_hours': gap_hours or conversation_gap_hours}
+
+def plot_last_message_of_conversation(data):
+    import matplotlib.pyplot as plt
+    fig, (ax_conversations, ax_latency) = plt.subplots(1, 2, figsize=(14, 6))
+
+    # Who starts and who ends the conversations in each chat
+    conversations = data['conversations']
+    index = np.arange(len(conversations))
+    bar_width = 0.35
+    ax_conversations.bar(index - bar_width/2, conversations['Started_Owner'], bar_width, label='Started by ' + data['owner_name'])
+    ax_conversations.bar(index - bar_width/2, conversations['Started_Other'], bar_width, bottom=conversations['Started_Owner'], label='Started by Other')
+    ax_conversations.bar(index + bar_width/2, conversations['Ended_Owner'], bar_width, label='Ended by ' + data['owner_name'])
+    ax_conversations.bar(index + bar_width/2, conversations['Ended_Other'], bar_width, bottom=conversations['Ended_Owner'], label='Ended by Other')
+    ax_conversations.set_xticks(index)
+    ax_conversations.set_xticklabels(conversations.index)
+    ax_conversations.set_xlabel('Chat')
+    ax_conversations.set_ylabel('Conversations')
+    ax_conversations.set_title(f"Conversation Start and End (gap > {data['gap_hours']:g}h)")
+    ax_conversations.legend()
+
+    # Reply latency distribution for the senders with the most replies
+    histogram = data['histogram']
+    top_senders = data['latency']['count'].sort_values(ascending=False).index[:8]
+    for sender in top_senders:
+        counts = histogram.loc[sender]
+        ax_latency.plot(histogram.columns, counts / max(counts.sum(), 1),
+                        label=f"{sender} (median {data['latency'].loc[sender, '50%']:.0f} min)")
+    ax_latency.set_xlabel('Reply Latency')
+    ax_latency.set_ylabel('Share of Replies')
+    ax_latency.set_title('Reply Latency by Sender')
+    ax_latency.legend()
 
-def answer_deviation():
-    chat_filter = choose_users()
+    plt.tight_layout()
+    return fig
 
-    df = pd.read_csv('all_chats.csv')
+def answer_deviation_data(chat_filter):
+    # The chunked walk selects chats itself, sender/date/owner filters need the rows in memory
+    if chunk_memory and not set(current_filters()) - {'chats'}:
+        return chunked_answer_deviation(chat_filter)
 
-    # Ensure the 'Datum' (Date) column is in datetime format
-    df['Datum'] = pd.to_datetime(df['Datum'], format='%d.%m.%y')
+    df = load_messages(['Chat', 'Timestamp', 'Is_Owner'])
 
     df = df[df['Chat'].isin(chat_filter)]
 
-    df["random_walk"] = df["Absender"].apply(lambda x: -1 if x == owner_name else 1)
+    # Chat by chat (by name, appended chats get the next free code) in time order, stable.
+    # So the walk does not depend on the store's row order or on when a chat was added.
+    chat_ranks = np.argsort(np.argsort(df['Chat'].cat.categories))
+    order = np.lexsort((df['Timestamp'].to_numpy().view(np.int64), chat_ranks[df['Chat'].cat.codes.to_numpy()]))
+    df = df.iloc[order]
 
-    df["random_walk"] = df["random_walk"].cumsum()
+    random_walk = np.where(df["Is_Owner"], -1, 1).cumsum()
+    return pd.DataFrame({'Timestamp': df['Timestamp'].to_numpy(), 'random_walk': random_walk})
 
-    plt.figure(figsize=(10, 6))
+def plot_answer_deviation(df):
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    fig = plt.figure(figsize=(10, 6))
 
     plt.axhline(0, color='grey', linewidth=1, linestyle='--')
 
-    plt.plot(df["Datum"], df["random_walk"])
+    plot_decimated(plt.gca(), df["Timestamp"], df["random_walk"])
     plt.title("Answer Deviation")
     plt.xlabel("Date")
     plt.ylabel("Answer Deviation")
@@ -382,30 +1760,27 @@ def answer_deviation():
     plt.xticks(rotation=45, ha='right')  # Rotate labels by 45 degrees for readability
 
     plt.tight_layout()
-    plt.show()
-
-def time_of_day_analysis():
-    chat_filter = choose_users()
+    return fig
 
-    df = pd.read_csv('all_chats.csv')
+def time_of_day_data(chat_filter):
+    df = load_rollup('hour')
 
     df = df[df['Chat'].isin(chat_filter)]
 
-    df['Uhrzeit'] = pd.to_datetime(df['Uhrzeit'], format='%H:%M')
-
-    # Extract the hour from the 'Uhrzeit' column
-    df['Hour'] = df['Uhrzeit'].dt.hour
+    # Group by 'Hour' and 'Chat' and sum up the message counts
+    message_counts = df.groupby(['Hour', 'Chat'], observed=True)['Message_Count'].sum().reset_index()
 
-    # Group by 'Hour' and 'Absender' (sender) and count the messages
-    message_counts = df.groupby(['Hour', 'Chat']).size().reset_index(name='Message_Count')
+    # Filter the data for the selected chats
+    message_counts = message_counts[message_counts['Chat'].isin(chat_filter)]
+    return {'counts': message_counts, 'chats': list(chat_filter)}
 
+def plot_time_of_day(data):
+    import matplotlib.pyplot as plt
     # Create a plot for each sender
-    plt.figure(figsize=(10, 6))
-
-    # Filter the data for a specific sender
-    message_counts = message_counts[message_counts['Chat'] == chat_filter]
+    fig = plt.figure(figsize=(10, 6))
 
     # We will create a line for each sender showing the number of messages per hour
+    message_counts = data['counts']
     for sender in message_counts['Chat'].unique():
         sender_data = message_counts[message_counts['Chat'] == sender]
         plt.plot(sender_data['Hour'], sender_data['Message_Count'], label=sender)
@@ -414,79 +1789,170 @@ def time_of_day_analysis():
     plt.xlabel('Hour of the Day')
     plt.xticks(range(0, 24, 2))  # Show every second hour
     plt.ylabel('Number of Messages')
-    plt.title('Time of Day Analysis of Messages - Chat: ' + chat_filter)
+    plt.title('Time of Day Analysis of Messages - Chat: ' + ', '.join(data['chats']))
+    plt.legend(title='Chat')
 
-    # Display the plot
     plt.tight_layout()
-    plt.show()
-
-def sentiment_analysis():
-
-    df = pd.read_csv('all_chats.csv')
+    return fig
+
+WEEKDAY_NAMES = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+DAY_NS = 86400 * 10**9
+HOUR_NS = 3600 * 10**9
+
+def rolling_mean(counts, window):
+    # Trailing window mean along the days axis from one cumulative sum (shorter windows at the start)
+    totals = np.cumsum(counts, axis=1)
+    before = np.zeros_like(totals)
+    before[:, window:] = totals[:, :-window]
+    return (totals - before) / np.minimum(np.arange(1, counts.shape[1] + 1), window)
+
+def run_lengths(active):
+    # Length of the run of True values ending at every position (0 where False), per row
+    positions = np.broadcast_to(np.arange(active.shape[1]), active.shape)
+    last_reset = np.maximum.accumulate(np.where(active, -1, positions), axis=1)
+    return np.where(active, positions - last_reset, 0)
+
+def activity_data(chat_filter):
+    df = load_messages(['Chat', 'Absender', 'Timestamp'])
+
+    df = df[df['Chat'].isin(chat_filter) & df['Timestamp'].notna()]
+
+    # Integer day/hour/weekday of every message, then one bincount per table for all chats at once
+    timestamps = df['Timestamp'].to_numpy().view(np.int64)
+    days = timestamps // DAY_NS
+    hours = timestamps // HOUR_NS % 24
+    weekdays = (days + 3) % 7  # 1970-01-01 was a Thursday, Monday = 0
+    chats = df['Chat'].cat.codes.to_numpy().astype(np.int64)
+    senders = df['Absender'].cat.codes.to_numpy().astype(np.int64)
+    chat_names = df['Chat'].cat.categories
+    sender_names = df['Absender'].cat.categories
+    first_day = days.min() if len(days) else 0
+    day_count = int(days.max() - first_day + 1) if len(days) else 1
+    day_index = pd.to_datetime((first_day + np.arange(day_count)) * DAY_NS)
+
+    slot = weekdays * 24 + hours
+    heatmap_by_chat = np.bincount(chats * 168 + slot, minlength=len(chat_names) * 168).reshape(-1, 7, 24)
+    heatmap_by_sender = np.bincount(senders * 168 + slot, minlength=len(sender_names) * 168).reshape(-1, 7, 24)
+    daily_by_chat = np.bincount(chats * day_count + (days - first_day), minlength=len(chat_names) * day_count).reshape(-1, day_count)
+    daily_by_sender = np.bincount(senders * day_count + (days - first_day), minlength=len(sender_names) * day_count).reshape(-1, day_count)
+
+    # Only the selected chats and the senders that wrote in them
+    chat_rows = np.flatnonzero(chat_names.isin(chat_filter))
+    sender_rows = np.flatnonzero(daily_by_sender.sum(axis=1) > 0)
+    heatmap_by_chat, daily_by_chat, chat_names = heatmap_by_chat[chat_rows], daily_by_chat[chat_rows], chat_names[chat_rows]
+    heatmap_by_sender, daily_by_sender, sender_names = heatmap_by_sender[sender_rows], daily_by_sender[sender_rows], sender_names[sender_rows]
+
+    # Streaks (consecutive days with messages) and gaps (days without, between the first and last message of a chat)
+    active = daily_by_chat > 0
+    streaks = run_lengths(active)
+    seen_before = np.maximum.accumulate(active, axis=1)
+    seen_after = np.maximum.accumulate(active[:, ::-1], axis=1)[:, ::-1]
+    gaps = run_lengths(~active & seen_before & seen_after)
+    streak_ends = streaks.argmax(axis=1)
+    last_days = day_count - 1 - active[:, ::-1].argmax(axis=1)
+    engagement = pd.DataFrame({
+        'Active_Days': active.sum(axis=1),
+        'Longest_Streak': streaks.max(axis=1, initial=0),
+        'Longest_Streak_End': day_index[streak_ends],
+        'Current_Streak': streaks[np.arange(len(chat_rows)), last_days],
+        'Longest_Gap': gaps.max(axis=1, initial=0),
+    }, index=chat_names)
+
+    heatmap_index = pd.MultiIndex.from_product([chat_names, WEEKDAY_NAMES], names=['Chat', 'Weekday'])
+    sender_heatmap_index = pd.MultiIndex.from_product([sender_names, WEEKDAY_NAMES], names=['Absender', 'Weekday'])
+    return {
+        'heatmap': pd.DataFrame(heatmap_by_chat.sum(axis=0), index=WEEKDAY_NAMES, columns=range(24)),
+        'heatmap_by_chat': pd.DataFrame(heatmap_by_chat.reshape(-1, 24), index=heatmap_index, columns=range(24)),
+        'heatmap_by_sender': pd.DataFrame(heatmap_by_sender.reshape(-1, 24), index=sender_heatmap_index, columns=range(24)),
+        'daily': pd.DataFrame(daily_by_chat.T, index=day_index, columns=chat_names),
+        'daily_by_sender': pd.DataFrame(daily_by_sender.T, index=day_index, columns=sender_names),
+        'rolling_7': pd.DataFrame(rolling_mean(daily_by_chat, 7).T, index=day_index, columns=chat_names),
+        'rolling_30': pd.DataFrame(rolling_mean(daily_by_chat, 30).T, index=day_index, columns=chat_names),
+        'engagement': engagement,
+        'chats': list(chat_filter),
+    }
+
+def plot_activity(data):
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    fig, (ax_heatmap, ax_rolling, ax_streaks) = plt.subplots(1, 3, figsize=(18, 6))
+
+    # Weekday x hour heatmap over the selected chats
+    image = ax_heatmap.imshow(data['heatmap'].to_numpy(), aspect='auto', cmap='viridis')
+    ax_heatmap.set_yticks(range(7))
+    ax_heatmap.set_yticklabels(data['heatmap'].index)
+    ax_heatmap.set_xticks(range(0, 24, 2))
+    ax_heatmap.set_xlabel('Hour of the Day')
+    ax_heatmap.set_title('Messages by Weekday and Hour')
+    fig.colorbar(image, ax=ax_heatmap, label='Messages')
+
+    # 30 day rolling average per chat
+    rolling = data['rolling_30']
+    for chat in rolling.columns:
+        plot_decimated(ax_rolling, rolling.index.to_numpy(), rolling[chat].to_numpy(), label=chat)
+    ax_rolling.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m'))
+    ax_rolling.tick_params(axis='x', rotation=45)
+    ax_rolling.set_ylabel('Messages per Day (30 day average)')
+    ax_rolling.set_title('Engagement over Time')
+    ax_rolling.legend(title='Chat')
+
+    # Longest streak and gap in days per chat
+    engagement = data['engagement']
+    index = np.arange(len(engagement))
+    bar_width = 0.35
+    ax_streaks.bar(index - bar_width/2, engagement['Longest_Streak'], bar_width, label='Longest Streak')
+    ax_streaks.bar(index + bar_width/2, engagement['Longest_Gap'], bar_width, label='Longest Gap')
+    ax_streaks.set_xticks(index)
+    ax_streaks.set_xticklabels(engagement.index)
+    ax_streaks.set_ylabel('Days')
+    ax_streaks.set_title('Streaks and Gaps')
+    ax_streaks.legend()
+
+    fig.suptitle('Activity of Chat: ' + ', '.join(data['chats']))
+    plt.tight_layout()
+    return fig
 
-    df['Nachricht'] = df['Nachricht'].astype(str)
+def sentiment_data(chat_filter=None):
+    df = load_messages(['Chat', 'Is_Owner'])
 
-    df_other = df[df['Absender'] != owner_name]
-    df_owner = df[df['Absender'] == owner_name]
+    # Polarity and subjectivity are computed once per message and cached
+    # (aligned by store row, df may only hold the rows of the active filters)
+    sentiment = load_sentiment()
+    rows = df.index.to_numpy()
+    df['Sentiment'] = sentiment['Polarity'].to_numpy()[rows]
 
     #TODO: Does this makes sense?
     #filter out messages with high objectivity (since they dont really matter for polarity)
-    df_other = df_other[df_other['Nachricht'].apply(lambda x: TextBlob(x).sentiment.subjectivity) < 0.5]
-    df_owner = df_owner[df_owner['Nachricht'].apply(lambda x: TextBlob(x).sentiment.subjectivity) < 0.5]
+    df = df[sentiment['Subjectivity'].to_numpy()[rows] < 0.5]
 
-    # Calculate the length of each message
-    df_other['Sentiment'] = df_other['Nachricht'].apply(lambda x: TextBlob(x).sentiment.polarity)
-    df_owner['Sentiment'] = df_owner['Nachricht'].apply(lambda x: TextBlob(x).sentiment.polarity)
+    df_other = df[~df['Is_Owner']]
+    df_owner = df[df['Is_Owner']]
 
-    # Group by 'Absender' (sender) and calculate the average message length
-    avg_sentiment_other = df_other.groupby('Chat')['Sentiment'].mean()
-    avg_sentiment_owner = df_owner.groupby('Chat')['Sentiment'].mean()
+    # Group by 'Chat' and calculate the average sentiment
+    avg_sentiment_other = df_other.groupby('Chat', observed=False)['Sentiment'].mean()
+    avg_sentiment_owner = df_owner.groupby('Chat', observed=False)['Sentiment'].mean()
+    return {'other': analysed_chats(avg_sentiment_other, chat_filter), 'owner': analysed_chats(avg_sentiment_owner, chat_filter),
+            'owner_name': current_owner()}
 
-    # Create a figure and axis
-    fig, ax = plt.subplots(figsize=(10, 6))
+def plot_sentiment(data):
+    return plot_grouped_bars(data, 'Average Sentiment', 'Average Sentiment by Sender')
 
-    # Define the width of each bar
-    bar_width = 0.35
+def own_message_frequency_data(chat_filter=None):
+    df = load_rollup('month')
 
-    # Define the x positions for the bars
-    index = np.arange(len(df['Chat'].unique()))
+    df = df[df['Is_Owner']]
 
-    # Plot the bars for Sender1 and Sender2
-    ax.bar(index - bar_width/2, avg_sentiment_other.values, bar_width, label='Other')
-    ax.bar(index + bar_width/2, avg_sentiment_owner.values, bar_width, label=owner_name)
+    # Group by 'Month' and sum up the message counts
+    message_counts = df.groupby('Month')['Message_Count'].sum().reset_index()
+    return {'counts': message_counts, 'owner_name': current_owner()}
 
-    # Add labels and title
-    ax.set_xlabel('Chat')
-    ax.set_ylabel('Average Sentiment')
-    ax.set_title('Average Sentiment by Sender')
-    ax.set_xticks(index)  # Set x-axis tick positions
-    ax.set_xticklabels(df['Chat'].unique())  # Set x-axis tick labels to the Chat names
-
-    # Add the legend
-    ax.legend(title="Senders")
-
-    # Display the plot
-    plt.tight_layout()
-    plt.show()
-
-def own_message_frequency():
-    df = pd.read_csv('all_chats.csv')
-
-    df = df[df['Absender'] == owner_name]
-
-    # Ensure the 'Datum' (Date) column is in datetime format
-    df['Datum'] = pd.to_datetime(df['Datum'], format='%d.%m.%y')
-
-    # Create a new column that represents month intervals
-    df['Two_Month_Interval'] = df['Datum'].apply(lambda x: pd.Timestamp(datetime(x.year, ((x.month-1)//1)*1+1, 1)))
+def plot_own_message_frequency(data):
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    fig = plt.figure(figsize=(10, 6))
 
-    # Group by 'Month_Year' and 'Absender' (sender) and count the messages
-    message_counts = df.groupby('Two_Month_Interval').size().reset_index(name='Message_Count')
-
-    # Create a plot for each sender
-    plt.figure(figsize=(10, 6))
-
-    plt.plot(message_counts['Two_Month_Interval'], message_counts['Message_Count'])
+    message_counts = data['counts']
+    plot_decimated(plt.gca(), message_counts['Month'], message_counts['Message_Count'])
 
     # Format the x-axis to show the timeline
     plt.gca().xaxis.set_major_locator(mdates.YearLocator())
@@ -500,48 +1966,530 @@ def own_message_frequency():
     # Add labels and title
     plt.xlabel('Month')
     plt.ylabel('Number of Messages')
-    plt.title('Timeline of Messages by ' + owner_name +' (Fist Message - Present)')
+    plt.title('Timeline of Messages by ' + data['owner_name'] +' (Fist Message - Present)')
 
-    # Display the plot
     plt.tight_layout()
-    plt.show()
+    return fig
+
+def top_words_data(chat_filter):
+    # Served from the word/bigram counts of the search index, the messages are not read again.
+    # Those counts are per chat, so with sender or date filters the filtered rows are counted instead
+    filters = current_filters()
+    if 'senders' in filters or 'since' in filters or 'until' in filters:
+        words, bigrams = filtered_top_terms()
+    else:
+        words, bigrams = top_terms(chat_filter, 1), top_terms(chat_filter, 2)
+    return {'words': words, 'bigrams': bigrams, 'chats': list(chat_filter)}
+
+def plot_top_words(data):
+    import matplotlib.pyplot as plt
+    fig, axes = plt.subplots(1, 2, figsize=(12, 6))
+
+    for ax, terms, title in ((axes[0], data['words'], 'Top Words'), (axes[1], data['bigrams'], 'Top Word Pairs')):
+        # Most frequent at the top
+        ax.barh(terms.index[::-1], terms.values[::-1])
+        ax.set_xlabel('Count')
+        ax.set_title(title)
+
+    fig.suptitle('Vocabulary of Chat: ' + ', '.join(data['chats']))
+    plt.tight_layout()
+    return fig
+
+def media_data(chat_filter):
+    media = load_media()
+    media = media[media['Chat'].isin(chat_filter)]
+    filters = current_filters()
+    if 'senders' in filters:
+        media = media[media['Absender'].isin(filters['senders'])]
+    if 'since' in filters:
+        media = media[media['Month'] >= pd.Timestamp(filters['since']).to_period('M').to_timestamp()]
+    if 'until' in filters:
+        media = media[media['Month'] < pd.Timestamp(filters['until'])]
+
+    # Counts and bytes by type per chat, counts by type per month and per sender
+    by_chat = media.groupby(['Chat', 'Type'], observed=False).agg(Count=('Type', 'size'), Bytes=('Bytes', 'sum'))
+    by_month = media.groupby(['Month', 'Type'], observed=False).size().unstack(fill_value=0)
+    by_sender = media.groupby(['Absender', 'Type'], observed=False).size().unstack(fill_value=0)
+    by_sender = by_sender.loc[by_sender.sum(axis=1).sort_values(ascending=False).index[:10]]
+    return {'by_chat': by_chat, 'by_month': by_month, 'by_sender': by_sender, 'chats': list(chat_filter)}
+
+def plot_media(data):
+    import matplotlib.pyplot as plt
+    fig, (ax_bytes, ax_month, ax_sender) = plt.subplots(1, 3, figsize=(16, 6))
+
+    # Megabytes by type per chat (stacked)
+    megabytes = data['by_chat']['Bytes'].unstack(fill_value=0) / 1e6
+    bottom = np.zeros(len(megabytes))
+    for media_type in megabytes.columns:
+        ax_bytes.bar(megabytes.index, megabytes[media_type], bottom=bottom, label=media_type)
+        bottom += megabytes[media_type].to_numpy()
+    ax_bytes.set_xlabel('Chat')
+    ax_bytes.set_ylabel('MB')
+    ax_bytes.set_title('Media Size by Type')
+    ax_bytes.legend()
+
+    # Files per month and type
+    by_month = data['by_month']
+    if len(by_month):
+        ax_month.stackplot(by_month.index, by_month.T.to_numpy(), labels=by_month.columns)
+    ax_month.set_xlabel('Month')
+    ax_month.set_ylabel('Files')
+    ax_month.set_title('Media per Month')
+    ax_month.tick_params(axis='x', rotation=45)
+
+    # Files by type per sender
+    by_sender = data['by_sender']
+    left = np.zeros(len(by_sender))
+    for media_type in by_sender.columns:
+        ax_sender.barh(by_sender.index, by_sender[media_type], left=left, label=media_type)
+        left += by_sender[media_type].to_numpy()
+    ax_sender.set_xlabel('Files')
+    ax_sender.set_title('Media by Sender')
+
+    fig.suptitle('Media in Chat: ' + ', '.join(data['chats']))
+    plt.tight_layout()
+    return fig
+
+# mode -> (asks for a chat filter, data function, plot function)
+ANALYSIS_MODES = {
+    "Message Amount": (False, message_amount_data, plot_message_amount),
+    "Message Frequency": (True, message_frequency_data, plot_message_frequency),
+    "Average Message Length": (False, message_length_data, plot_message_length),
+    "Emoji Analysis": (True, emoji_data, plot_emoji),
+    "Answer Deviation": (True, answer_deviation_data, plot_answer_deviation),
+    "Last Message of Conversaion": (True, last_message_of_conversation_data, plot_last_message_of_conversation),
+    "Time of Day Analysis": (True, time_of_day_data, plot_time_of_day),
+    "Sentiment Analysis": (False, sentiment_data, plot_sentiment),
+    "Own Message Frequency": (False, own_message_frequency_data, plot_own_message_frequency),
+    "Top Words": (True, top_words_data, plot_top_words),
+    "Media Analysis": (True, media_data, plot_media),
+    "Activity Heatmap": (True, activity_data, plot_activity),
+}
+#--------------------------------------------
+#Analysis API: analyse() returns the plain result of a mode (the dict/DataFrame its plot function draws).
+#Results are kept in a small LRU cache keyed by the request and the store version, so new data is never
+#served from it. Cached results are shared, callers must not modify them.
+#--------------------------------------------
+
+ANALYSIS_CACHE_SIZE = 32
+analysis_cache = OrderedDict()
+analysis_cache_lock = threading.Lock()
+
+def analyse(mode, chats=None, senders=None, since=None, until=None, owner=None):
+    # chats=None -> all chats; senders/since/until restrict the rows, owner overrides the detected owner
+    meta = load_store_meta()
+    chat_filter = list(chats) if chats else list(meta['chats'])
+    key = analysis_key(mode, chat_filter, senders, since, until, owner)
+    result = memo_get(key)
+    if result is None:
+        with filtered_analysis(chats and chat_filter, senders or None, since, until, owner):
+            result = compute_mode(mode, chat_filter)
+        memo_put(key, result)
+    return result
+
+def analysis_key(*request):
+    # The request plus everything else a result depends on
+    return tuple(tuple(part) if isinstance(part, list) else part for part in request) + (
+        owner_name, os.path.abspath(store_folder), store_version(store_folder), conversation_gap_hours, chunk_memory)
+
+def memo_get(key, default=None):
+    with analysis_cache_lock:
+        if key not in analysis_cache:
+            return default
+        analysis_cache.move_to_end(key)
+        return analysis_cache[key]
+
+def memo_put(key, value):
+    with analysis_cache_lock:
+        analysis_cache[key] = value
+        analysis_cache.move_to_end(key)
+        while len(analysis_cache) > ANALYSIS_CACHE_SIZE:
+            analysis_cache.popitem(last=False)
+
+#--------------------------------------------
+#Background jobs (the Tk main thread only prompts and draws)
+#--------------------------------------------
+
+action_buttons = []
+status_text = None
+cancel_button = None
+background_job = {}
+# Cancel event of the background job running in the current thread, long loops check it (see job_cancelled)
+job_context = threading.local()
+
+def job_cancelled():
+    cancel = getattr(job_context, 'cancel', None)
+    return cancel is not None and cancel.is_set()
+
+def set_busy(busy, text=""):
+    for button in action_buttons:
+        button.config(state=tk.DISABLED if busy else tk.NORMAL)
+    cancel_button.config(state=tk.NORMAL if busy else tk.DISABLED)
+    status_text.set(text)
+
+def run_in_background(description, task, on_done):
+    # task(cancel, report) runs in a worker thread; report(text) updates the status line.
+    # on_done(result) runs on the main thread, unless the job was cancelled.
+    if background_job.get('thread') and background_job['thread'].is_alive():
+        return
+    cancel = threading.Event()
+    updates = queue.Queue()
+
+    def worker():
+        job_context.cancel = cancel
+        try:
+            updates.put(('done', task(cancel, lambda text: updates.put(('progress', text)))))
+        except CancelledError:
+            updates.put(('done', None))
+        except Exception as error:
+            updates.put(('error', error))
+
+    background_job.update(thread=threading.Thread(target=worker, daemon=True), cancel=cancel, updates=updates,
+                          on_done=on_done, description=description)
+    set_busy(True, description + "...")
+    background_job['thread'].start()
+    window.after(100, poll_background_job)
+
+def poll_background_job():
+    while True:
+        try:
+            kind, value = background_job['updates'].get_nowait()
+        except queue.Empty:
+            window.after(100, poll_background_job)
+            return
+        if kind == 'progress':
+            status_text.set(background_job['description'] + ": " + value)
+        elif kind == 'error':
+            set_busy(False, background_job['description'] + " failed: " + str(value))
+            return
+        else:
+            if background_job['cancel'].is_set():
+                set_busy(False, background_job['description'] + " cancelled.")
+            else:
+                set_busy(False, background_job['description'] + " done.")
+                background_job['on_done'](value)
+            return
+
+def on_cancel():
+    if background_job.get('cancel'):
+        background_job['cancel'].set()
+        status_text.set(background_job['description'] + ": cancelling...")
+
 #--------------------------------------------
 
 def on_prepare_data():
-    print("Data preparation started...")
-    prepare_data()
-    print("Data preparation completed.")
+    # Labels of new archives are asked for here, on the main thread - the worker thread runs unattended
+    chat_labels = {}
+    if window is not None:
+        for file_name in unlabelled_archives():
+            default_label = chat_label_from_file_name(file_name)
+            label = simpledialog.askstring("Input", "Enter the name of the chat - " + os.path.splitext(file_name)[0] + ":",
+                                           initialvalue=default_label, parent=window)
+            chat_labels[file_name] = (label or "").strip() or default_label
+
+    def task(cancel, report):
+        def progress(archives_done, archives_total, messages_parsed):
+            report(str(archives_done) + "/" + str(archives_total) + " archives, " + str(messages_parsed) + " messages parsed")
+        prepare_data(progress=progress, cancel=cancel, interactive=window is None, chat_labels=chat_labels)
+        return detect_owner_name()
+
+    def done(detected_owner):
+        global owner_name
+        owner_name = detected_owner
+
+    if window is None:
+        print("Data preparation started...")
+        done(task(threading.Event(), print))
+        print("Data preparation completed.")
+    else:
+        run_in_background("Data preparation", task, done)
+
+def detect_owner_name(store=None):
+    # Detected once at ingest time, see write_message_store
+    return load_store_meta(store)['owner_name']
 
-def detect_owner_name():
-    df = pd.read_csv('all_chats.csv')
-    df = df.groupby('Chat')['Absender'].unique().reset_index()
+def compute_mode(mode, chat_filter):
+    with instrument('analysis: ' + mode), cprofile_hook(mode):
+        return ANALYSIS_MODES[mode][1](chat_filter)
 
-    common_elements = set(df['Absender'].iloc[0])  # Start with the first row's set
-    for senders in df['Absender']:
-        common_elements.intersection_update(senders)  # Keep only elements present in all rows
-    return common_elements.pop()  # Return the only element left
+def render_mode(mode, data):
+    with instrument('plot render: ' + mode):
+        return ANALYSIS_MODES[mode][2](data)
 
 def on_analysis_mode(mode):
-    if mode == "Message Amount":
-        analyse_message_amount()
-    elif mode == "Message Frequency":
-        analyse_message_frequency()
-    elif mode == "Average Message Length":
-        analyse_message_length()
-    elif mode == "Emoji Analysis":
-        analyse_emoji()
-    elif mode == "Answer Deviation":
-        answer_deviation()
-    elif mode == "Last Message of Conversaion":
+    import matplotlib.pyplot as plt
+    uses_chat_filter = ANALYSIS_MODES[mode][0]
+    chat_filter = choose_users() if uses_chat_filter else None
+
+    def show(data):
+        render_mode(mode, data)
+        plt.show()
+
+    if window is None:
+        show(analyse(mode, chat_filter))
+    else:
+        run_in_background(mode, lambda cancel, report: analyse(mode, chat_filter), show)
+
+def format_search_results(results):
+    return "\n".join(f"{row.Timestamp:%d.%m.%y %H:%M}  {row.Chat}  {row.Absender}: {row.Nachricht}" for row in results.itertuples())
+
+def on_search():
+    query = simpledialog.askstring("Search", 'Search messages (words must all occur, "quoted text" is a phrase):', parent=window)
+    if not query:
+        return
+    chat_filter = choose_users()
+
+    def show(results):
+        result_window = tk.Toplevel(window)
+        result_window.title("Search: " + query + " (" + str(len(results)) + " messages)")
+        text = tk.Text(result_window, wrap=tk.WORD, width=120, height=30)
+        text.insert(tk.END, format_search_results(results) or "No messages found.")
+        text.configure(state=tk.DISABLED)
+        text.pack(fill=tk.BOTH, expand=True)
+
+    run_in_background("Search", lambda cancel, report: search_messages(query, chat_filter, limit=1000), show)
+
+#--------------------------------------------
+#Process pool workers: with spawn (Windows, macOS) they import main afresh, so the settings that
+#were changed from the command line are handed to them explicitly
+#--------------------------------------------
+
+def pool_worker_settings():
+    return {'owner_name': owner_name, 'conversation_gap_hours': conversation_gap_hours, 'chunk_memory': chunk_memory,
+            'cprofile_mode': cprofile_mode, 'profile_report_file': profile_report_file}
+
+def init_pool_worker(settings):
+    # ProcessPoolExecutor initializer, with pool_worker_settings() of the parent
+    global owner_name, conversation_gap_hours, chunk_memory, cprofile_mode
+    owner_name = settings['owner_name']
+    conversation_gap_hours = settings['conversation_gap_hours']
+    chunk_memory = settings['chunk_memory']
+    cprofile_mode = settings['cprofile_mode']
+    if settings['profile_report_file'] and not profile_report_file:
+        enable_profiling(settings['profile_report_file'])
+
+#--------------------------------------------
+#Headless report (no Tk, non-interactive matplotlib backend)
+#--------------------------------------------
+
+def report_file_name(mode, image_format):
+    return mode.lower().replace(' ', '_') + '.' + image_format
+
+def render_report_mode(mode, chat_filter, output_folder, image_format):
+    import matplotlib.pyplot as plt
+    # Runs in a worker process: compute one mode (through the analysis API, so modes that take no chat
+    # argument are restricted to the chats, too) and write its figure. The owner comes from init_pool_worker.
+    plt.switch_backend('Agg')
+    data = analyse(mode, chat_filter)
+    with instrument('plot render: ' + mode):
+        fig = ANALYSIS_MODES[mode][2](data)
+        output_path = os.path.join(output_folder, report_file_name(mode, image_format))
+        fig.savefig(output_path)
+    plt.close(fig)
+    return output_path
+
+def create_report(output_folder, chat_filter=None, image_format='png', workers=None):
+    # Render every analysis mode to output_folder, the figures are produced concurrently across processes
+    global owner_name
+    os.makedirs(output_folder, exist_ok=True)
+    owner_name = detect_owner_name()
+    chat_filter = chat_filter or load_store_meta()['chats']
+    modes = list(ANALYSIS_MODES)
+
+    rendered = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_pool_worker, initargs=(pool_worker_settings(),)) as executor:
+        futures = {mode: executor.submit(call_with_stages, render_report_mode, mode, chat_filter, output_folder, image_format) for mode in modes}
+        for mode, future in futures.items():
+            try:
+                rendered[mode], stages = future.result()
+                stage_records.extend(stages)
+                print("Rendered " + mode + " -> " + rendered[mode])
+            except Exception as error:
+                print("Failed to render " + mode + ": " + repr(error))
+    return rendered
+
+#--------------------------------------------
+#Local JSON server (--serve): one process holds the loaded store, light modes run in threads,
+#CPU heavy ones in a process pool started after the store was loaded
+#--------------------------------------------
+
+SERVER_HEAVY_MODES = {"Emoji Analysis", "Sentiment Analysis", "Last Message of Conversaion", "Media Analysis"}
+SERVER_MAX_POINTS = 2000  # default size of decimated series (answer deviation)
+pending_responses = {}  # response key -> future of the request that computes it (event loop thread only)
+MODE_SLUGS = {mode.lower().replace(' ', '_'): mode for mode in ANALYSIS_MODES}
+
+def json_value(value):
+    # Results as JSON-ready values; frames and series keep their index ("split" layout)
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return json.loads(value.to_json(orient='split', date_format='iso'))
+    if isinstance(value, dict):
+        return {str(key): json_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_value(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def request_filters(params):
+    # ?chats=Anna,Jonas&senders=Martin&since=2024-01-01&until=2024-02-01&owner=Martin
+    filters = {}
+    for name in ('chats', 'senders'):
+        if params.get(name):
+            filters[name] = [item.strip() for item in params[name].split(',') if item.strip()]
+    for name in ('since', 'until', 'owner'):
+        if params.get(name):
+            filters[name] = params[name]
+    for name in ('since', 'until'):
+        if name in filters:
+            pd.Timestamp(filters[name])  # raises ValueError for a bad date -> 400
+    return filters
+
+def analysis_response(mode, filters, points):
+    # Runs in a worker thread or process; the response body is encoded there, too
+    result = analyse(mode, filters.get('chats'), filters.get('senders'), filters.get('since'), filters.get('until'), filters.get('owner'))
+    if isinstance(result, pd.DataFrame) and 'random_walk' in result:
+        result = result.iloc[decimate_min_max(result['random_walk'].to_numpy(), max(points // 2, 1))]
+    return json.dumps({'mode': mode, 'filters': filters, 'result': json_value(result)}, ensure_ascii=False).encode('utf-8')
+
+def aggregate_response(name, filters):
+    with filtered_analysis(**filters):
+        rollup = load_rollup(name)
+    return json.dumps({'aggregate': name, 'filters': filters, 'rows': json_value(rollup.reset_index(drop=True))},
+                      ensure_ascii=False).encode('utf-8')
+
+def search_response(query, filters, limit):
+    results = search_messages(query, filters.get('chats'), filters.get('senders'), filters.get('since'), filters.get('until'), limit)
+    return json.dumps({'query': query, 'filters': filters, 'messages': json_value(results)}, ensure_ascii=False).encode('utf-8')
+
+def warm_worker():
+    return os.getpid()
+
+async def route_request(path, params, executor):
+    # -> (status, body); responses are memoized together with the analysis results
+    loop = asyncio.get_running_loop()
+    if path in ('/', '/modes'):
+        meta = load_store_meta()
+        return 200, json.dumps({'modes': MODE_SLUGS,
+                                'aggregates': ['month', 'hour'], 'chats': meta['chats'], 'senders': meta['senders'],
+                                'owner_name': owner_name},
+                               ensure_ascii=False).encode('utf-8')
+
+    filters = request_filters(params)
+    key = analysis_key('response', path, tuple(sorted(params.items())))
+    body = memo_get(key)
+    if body is not None:
+        return 200, body
+    # Identical requests that arrive while one is computed wait for it instead of computing again
+    if key in pending_responses:
+        return await asyncio.shield(pending_responses[key])
+    pending_responses[key] = loop.create_future()
+    try:
+        response = await compute_response(path, params, filters, executor)
+    except BaseException as error:
+        future = pending_responses.pop(key)
+        if isinstance(error, asyncio.CancelledError):
+            future.cancel()
+        else:
+            future.set_exception(error)
+            # Retrieved right away: usually no duplicate request waits on it, asyncio would log it as never retrieved
+            future.exception()
+        raise
+    pending_responses.pop(key).set_result(response)
+    if response[0] == 200:
+        memo_put(key, response[1])
+    return response
+
+async def compute_response(path, params, filters, executor):
+    loop = asyncio.get_running_loop()
+    if path.startswith('/analysis/'):
+        name = path[len('/analysis/'):]
+        mode = MODE_SLUGS.get(name, name)
+        if mode not in ANALYSIS_MODES:
+            return 404, json.dumps({'error': 'unknown mode ' + name}).encode('utf-8')
+        points = int(params.get('points', SERVER_MAX_POINTS))
+        body = await loop.run_in_executor(executor if mode in SERVER_HEAVY_MODES else None, analysis_response, mode, filters, points)
+    elif path in ('/aggregates/month', '/aggregates/hour'):
+        body = await loop.run_in_executor(None, aggregate_response, path.rsplit('/', 1)[1], filters)
+    elif path == '/search':
+        if not params.get('q'):
+            return 400, json.dumps({'error': 'missing q'}).encode('utf-8')
+        body = await loop.run_in_executor(None, search_response, params['q'], filters, int(params.get('limit', 100)))
+    else:
+        return 404, json.dumps({'error': 'not found'}).encode('utf-8')
+    return 200, body
+
+async def handle_connection(reader, writer, executor):
+    # Minimal HTTP/1.1: GET only, keep-alive unless the client asks to close
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, target, version = request_line.decode('latin-1').split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            url = urllib.parse.urlsplit(target)
+            params = dict(urllib.parse.parse_qsl(url.query))
+            start = perf_counter()
+            if method != 'GET':
+                status, body = 405, json.dumps({'error': 'only GET is supported'}).encode('utf-8')
+            else:
+                try:
+                    status, body = await route_request(urllib.parse.unquote(url.path), params, executor)
+                except ValueError as error:
+                    status, body = 400, json.dumps({'error': str(error)}).encode('utf-8')
+                except Exception as error:
+                    status, body = 500, json.dumps({'error': repr(error)}).encode('utf-8')
+            if profile_report_file:
+                add_stage_record('server: ' + url.path, perf_counter() - start)
+
+            keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+            writer.write((f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}\r\n"
+                          f"Content-Type: application/json; charset=utf-8\r\nContent-Length: {len(body)}\r\n"
+                          f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode('latin-1') + body)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, ValueError):
         pass
-    elif mode == "Time of Day Analysis":
-        time_of_day_analysis()
-    elif mode == "Sentiment Analysis":
-        sentiment_analysis()
-    elif mode == "Own Message Frequency":
-        own_message_frequency()
+    finally:
+        writer.close()
+
+def serve(host='127.0.0.1', port=8765, workers=None):
+    global owner_name
+    # Load the store once. With fork the pool workers start with the same columns and rollups, with spawn
+    # they load them on first use. Either way they get the parent's settings (gap, chunk size, owner) from
+    # init_pool_worker, results are memoized under keys that include them.
+    owner_name = detect_owner_name()
+    load_messages()
+    load_rollup('month')
+    load_rollup('hour')
+    workers = workers or os.cpu_count()
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=init_pool_worker, initargs=(pool_worker_settings(),))
+    for future in [executor.submit(warm_worker) for _ in range(workers)]:
+        future.result()
+
+    async def run_server():
+        server = await asyncio.start_server(lambda reader, writer: handle_connection(reader, writer, executor), host, port)
+        print(f"Serving http://{host}:{port}/ ({load_store_meta()['rows']} messages)")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run_server())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown(cancel_futures=True)
 
 def create_window():
+    global window, status_text, cancel_button
     # Create the main window
     window = tk.Tk()
     window.title("Data Analysis Tool")
@@ -549,6 +2497,12 @@ def create_window():
     # Create a "Prepare Data" button at the top
     prepare_button = tk.Button(window, text="Prepare Data", command=on_prepare_data)
     prepare_button.pack(pady=10)
+    action_buttons.append(prepare_button)
+
+    # Full-text search over all messages
+    search_button = tk.Button(window, text="Search Messages", command=on_search)
+    search_button.pack(pady=5)
+    action_buttons.append(search_button)
 
     # Create a label for the instruction text
     instruction_label = tk.Label(window, text="Select analysis mode from below.")
@@ -558,18 +2512,64 @@ def create_window():
     mode_frame = tk.Frame(window)
     mode_frame.pack(pady=10)
 
-    # List of analysis modes
-    modes = ["Message Amount", "Message Frequency", "Average Message Length", "Emoji Analysis", "Answer Deviation", "Last Message of Conversaion", "Time of Day Analysis", "Sentiment Analysis", "Own Message Frequency"]
-
-    # Create a button for half of the analysis modes
-    for mode in modes:
+    # Create a button for each analysis mode
+    for mode in ANALYSIS_MODES:
         mode_button = tk.Button(mode_frame, text=mode, command=lambda m=mode: on_analysis_mode(m))
         mode_button.pack(side=tk.LEFT, padx=10)
+        action_buttons.append(mode_button)
+
+    # Status line and cancel button for the running background job
+    status_frame = tk.Frame(window)
+    status_frame.pack(pady=10)
+    status_text = tk.StringVar(window)
+    tk.Label(status_frame, textvariable=status_text).pack(side=tk.LEFT, padx=10)
+    cancel_button = tk.Button(status_frame, text="Cancel", command=on_cancel, state=tk.DISABLED)
+    cancel_button.pack(side=tk.LEFT, padx=10)
 
     # Run the Tkinter event loop
     window.mainloop()
 
 if __name__ == "__main__":
-    owner_name = detect_owner_name()
-    create_window()
+    parser = argparse.ArgumentParser(description="WhatsApp Chat Analyzer")
+    parser.add_argument("--prepare", action="store_true", help="ingest ./chat_data without the GUI and exit (labels from chat_data/labels.json or the archive name)")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size for --prepare, --report and --serve")
+    parser.add_argument("--full", action="store_true", help="re-parse every archive instead of only new or changed ones")
+    parser.add_argument("--report", metavar="FOLDER", help="render every analysis mode into FOLDER without the GUI and exit")
+    parser.add_argument("--chats", help="comma separated chats for the report or the search (default: all)")
+    parser.add_argument("--format", choices=["png", "svg"], default="png", help="image format of the report")
+    parser.add_argument("--serve", nargs="?", type=int, const=8765, metavar="PORT", help="serve the analyses as JSON over HTTP (default port 8765)")
+    parser.add_argument("--host", default="127.0.0.1", help="address for --serve (default: local only)")
+    parser.add_argument("--search", metavar="QUERY", help='print the messages matching QUERY (words, "a phrase") and exit')
+    parser.add_argument("--senders", help="comma separated senders for --search (default: all)")
+    parser.add_argument("--since", help="only --search messages from this date on (e.g. 2024-01-31)")
+    parser.add_argument("--until", help="only --search messages before this date")
+    parser.add_argument("--limit", type=int, default=100, help="maximum number of --search results")
+    parser.add_argument("--conversation-gap", type=float, metavar="HOURS", help="silence after which a new conversation starts (default 6)")
+    parser.add_argument("--chunk-mb", type=int, help="analyse the store in batches of about this many MB instead of loading whole columns")
+    parser.add_argument("--profile", metavar="FILE", help="write a per-stage timing/memory report (.json or text) at exit")
+    parser.add_argument("--cprofile-mode", metavar="MODE", help="run cProfile around this analysis mode")
+    args = parser.parse_args()
+
+    if args.profile:
+        enable_profiling(args.profile)
+    if args.cprofile_mode:
+        cprofile_mode = args.cprofile_mode
+    if args.conversation_gap:
+        conversation_gap_hours = args.conversation_gap
+    if args.chunk_mb:
+        chunk_memory = args.chunk_mb << 20
+
+    if args.prepare:
+        prepare_data(workers=args.workers, interactive=False, incremental=not args.full)
+    chat_filter = [chat.strip() for chat in args.chats.split(',')] if args.chats else None
+    if args.report:
+        create_report(args.report, chat_filter, args.format, args.workers)
+    if args.search:
+        senders = [sender.strip() for sender in args.senders.split(',')] if args.senders else None
+        print(format_search_results(search_messages(args.search, chat_filter, senders, args.since, args.until, args.limit)))
+    if args.serve:
+        serve(args.host, args.serve, args.workers)
+    if not (args.prepare or args.report or args.search or args.serve):
+        owner_name = detect_owner_name()
+        create_window()
 
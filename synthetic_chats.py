@@ -0,0 +1,112 @@
+import argparse
+import io
+import os
+import random
+import zipfile
+from datetime import datetime, timedelta
+
+#--------------------------------------------
+#Synthetic WhatsApp exports for benchmarks (no real chats needed)
+#--------------------------------------------
+
+OWNER = "Martin"
+NAMES = ["Anna", "Jonas", "Lea", "Paul", "Sophie", "Felix", "Marie", "Lukas", "Emma", "Noah", "Mia", "Elias"]
+EMOJIS = ["😀", "😂", "👍", "👍🏽", "❤️", "🇩🇪", "👨‍👩‍👧‍👦", "🙈", "🎉", "😅"]
+WORDS = ["hallo", "wie", "geht's", "dir", "heute", "morgen", "ja", "nein", "ok", "super", "danke", "bis", "später"]
+# prefix, extension of the files WhatsApp puts next to the chat text
+MEDIA_TYPES = [("IMG", "jpg"), ("VID", "mp4"), ("PTT", "opus"), ("AUD", "opus"), ("STK", "webp")]
+HEADER_LINES = ["{prefix}Nachrichten und Anrufe sind Ende-zu-Ende-verschlüsselt.\n",
+                "{prefix}" + OWNER + " hat die Gruppe erstellt.\n"]
+# Line prefixes of the export dialects main.py detects
+TIMESTAMP_FORMATS = {"android_de": "%d.%m.%y, %H:%M - ",
+                     "android_de_4y": "%d.%m.%Y, %H:%M - ",
+                     "ios": "[%d/%m/%Y, %H:%M:%S] ",
+                     "en_12h": None}
+
+def format_prefix(timestamp, dialect="android_de"):
+    if dialect == "en_12h":
+        # "1/31/25, 2:17 PM - " with the narrow no-break space of newer exports
+        return f"{timestamp.month}/{timestamp.day}/{timestamp:%y}, {(timestamp.hour - 1) % 12 + 1}:{timestamp:%M}\u202f{timestamp:%p} - "
+    return timestamp.strftime(TIMESTAMP_FORMATS[dialect])
+
+def make_text(rng, emoji_density, word_count):
+    return " ".join(rng.choice(EMOJIS) if rng.random() < emoji_density else rng.choice(WORDS) for _ in range(word_count))
+
+def make_chat_lines(line_count, multiline_ratio=0.1, seed=0, emoji_density=0.0, dialect="android_de"):
+    # Build an in-memory export, by default in the "31.01.25, 02:17 - Absender: Nachricht" format (random dates)
+    rng = random.Random(seed)
+    senders = [OWNER] + NAMES[:3]
+    lines = [line.format(prefix=format_prefix(datetime(2025, 1, 31, 2, 17), dialect)) for line in HEADER_LINES]
+    while len(lines) < line_count:
+        timestamp = datetime(rng.randint(2018, 2025), rng.randint(1, 12), rng.randint(1, 28), rng.randint(0, 23),
+                             rng.randint(0, 59), rng.randint(0, 59))
+        text = make_text(rng, emoji_density, rng.randint(1, 12))
+        lines.append(f"{format_prefix(timestamp, dialect)}{rng.choice(senders)}: {text}\n")
+        if rng.random() < multiline_ratio:
+            lines.append(make_text(rng, 0.0, rng.randint(1, 8)) + "\n")
+    return lines[:line_count]
+
+def iter_chat_lines(message_count, senders, rng, start, multiline_ratio=0.1, emoji_density=0.05, media_ratio=0.02, media=None,
+                    dialect="android_de"):
+    # Chronological export lines; attachment names are appended to media (list of (name, type prefix))
+    timestamp = start
+    yield from (line.format(prefix=format_prefix(start, dialect)) for line in HEADER_LINES)
+    for i in range(message_count):
+        # Bursts of quick replies with longer pauses in between
+        timestamp += timedelta(seconds=rng.expovariate(1 / 30) if rng.random() < 0.8 else rng.expovariate(1 / 36000))
+        sender = rng.choice(senders)
+        if media is not None and rng.random() < media_ratio:
+            prefix, extension = rng.choice(MEDIA_TYPES)
+            name = f"{prefix}-{timestamp:%Y%m%d}-WA{len(media):04d}.{extension}"
+            media.append((name, prefix))
+            text = name + " (Datei angehängt)"
+        else:
+            text = make_text(rng, emoji_density, rng.randint(1, 12))
+        yield f"{format_prefix(timestamp, dialect)}{sender}: {text}\n"
+        if rng.random() < multiline_ratio:
+            yield make_text(rng, emoji_density, rng.randint(1, 8)) + "\n"
+
+def generate_exports(output_folder, chat_count=5, message_count=10000, multiline_ratio=0.1, emoji_density=0.05,
+                     media_ratio=0.02, media_bytes=4096, seed=0, dialect="android_de"):
+    # Writes chat_count "WhatsApp-Chat mit <Name>.zip" archives with message_count messages in total.
+    # Every third chat is a group chat; the owner takes part in all of them.
+    os.makedirs(output_folder, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for chat_index in range(chat_count):
+        name = NAMES[chat_index % len(NAMES)] + ("" if chat_index < len(NAMES) else str(chat_index // len(NAMES)))
+        partners = [name] + (rng.sample(NAMES, 3) if chat_index % 3 == 2 else [])
+        chat_messages = message_count // chat_count + (1 if chat_index < message_count % chat_count else 0)
+        start = datetime(2018, 1, 1) + timedelta(days=rng.randint(0, 365))
+
+        path = os.path.join(output_folder, f"WhatsApp-Chat mit {name}.zip")
+        media = []
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            # Streamed into the archive, so even 10M messages never sit in memory at once
+            with zf.open(f"WhatsApp-Chat mit {name}.txt", 'w', force_zip64=True) as raw:
+                with io.TextIOWrapper(raw, encoding='utf-8', newline='') as text:
+                    for line in iter_chat_lines(chat_messages, [OWNER] + partners, rng, start, multiline_ratio,
+                                                emoji_density, media_ratio, media, dialect):
+                        text.write(line)
+            for media_name, prefix in media:
+                # Media is already compressed in real exports, so it is stored as is
+                zf.writestr(zipfile.ZipInfo(media_name), os.urandom(media_bytes), compress_type=zipfile.ZIP_STORED)
+        paths.append(path)
+    return paths
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic WhatsApp chat exports")
+    parser.add_argument("output_folder", help="folder for the generated .zip exports (e.g. ./chat_data)")
+    parser.add_argument("--chats", type=int, default=5, help="number of chat archives")
+    parser.add_argument("--messages", type=int, default=10000, help="number of messages over all chats")
+    parser.add_argument("--multiline", type=float, default=0.1, help="share of messages with a continuation line")
+    parser.add_argument("--emoji", type=float, default=0.05, help="probability that a word is an emoji")
+    parser.add_argument("--media", type=float, default=0.02, help="share of messages that are media attachments")
+    parser.add_argument("--media-bytes", type=int, default=4096, help="size of every fake media file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dialect", choices=sorted(TIMESTAMP_FORMATS), default="android_de", help="timestamp format of the export")
+    args = parser.parse_args()
+
+    for path in generate_exports(args.output_folder, args.chats, args.messages, args.multiline, args.emoji,
+                                 args.media, args.media_bytes, args.seed, args.dialect):
+        print(path)